@@ -1,82 +1,687 @@
+# pip install requests aiohttp
+
 import requests
+import argparse
+import asyncio
+import collections
 import concurrent.futures
+import glob
+import heapq
+import itertools
+import json
+import multiprocessing
 import os
-from datetime import datetime
+import random
+import shutil
+import socket
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
 import sys
+import zlib
+from lib import dns_cache
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
 
 # Constants
 NUM_THREADS = 10
+DNS_THREADS = 50
+STREAM_WINDOW = 100
+CHECKPOINT_FILE = os.path.join('result', 'checkpoint.db')
+CHECKPOINT_EVERY = 100
+ASYNC_CONCURRENCY = 1000
+ASYNC_PER_HOST = 8
 TIMEOUT_CONNECT = 10.0
 TIMEOUT_READ = 10.0
+TIMEOUT_MIN = 2.0
+TIMEOUT_PERCENTILE = 95
+TIMEOUT_FACTOR = 3.0
+LATENCY_WINDOW = 1000
+LATENCY_MIN_SAMPLES = 50
+LATENCY_REFRESH = 20
+# Rate limits are opt-in, 0 means unlimited
+HOST_RATE = 0.0
+DOMAIN_RATE = 0.0
+RATE_BURST = 5
+RATE_MAX_BUCKETS = 100000
+MAX_RETRIES = 2
+MAX_RETRY_AFTER = 30.0
+SECOND_LEVEL_LABELS = {'ac', 'co', 'com', 'edu', 'gov', 'net', 'org'}
+TIMING_NAMES = ('dns', 'connect', 'ttfb', 'wait', 'total')
+SUMMARY_PERCENTILES = (50, 90, 99)
+SUMMARY_SAMPLE_SIZE = 10000
 GOOD_STATUS = {200, 403, 503}
+HEAD_REJECTED_STATUS = {405, 501}
 USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/118.0.0.0 Safari/537.36"
 
 # Check login with headers to not be detected as bot
-def check_domain(domain):
-    headers = {
-        'User-Agent': USER_AGENT,
-        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-        'Accept-Language': 'en-US,en;q=0.5',
-        'Accept-Encoding': 'gzip, deflate, br',
-        'Connection': 'keep-alive',
-        'Upgrade-Insecure-Requests': '1',
+HEADERS = {
+    'User-Agent': USER_AGENT,
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.5',
+    'Accept-Encoding': 'gzip, deflate, br',
+    'Connection': 'keep-alive',
+    'Upgrade-Insecure-Requests': '1',
+}
+
+class LatencyTracker:
+    """Rolling latency window; when adaptive, timeouts follow its percentile instead of a fixed value."""
+
+    def __init__(self, window=LATENCY_WINDOW, percentile=TIMEOUT_PERCENTILE, factor=TIMEOUT_FACTOR, slo=None, adaptive=False):
+        self.adaptive = adaptive
+        self.samples = collections.deque(maxlen=window)
+        self.percentile = percentile
+        self.factor = factor
+        # Connect and read timeouts together must fit in the per-domain SLO
+        self.connect_limit = min(TIMEOUT_CONNECT, slo / 2) if slo else TIMEOUT_CONNECT
+        self.read_limit = min(TIMEOUT_READ, slo / 2) if slo else TIMEOUT_READ
+        self.current = (self.connect_limit, self.read_limit)
+        self.lock = threading.Lock()
+        self.recorded = 0
+
+    def record(self, seconds):
+        if not self.adaptive:
+            return
+        with self.lock:
+            self.samples.append(seconds)
+            self.recorded += 1
+            if len(self.samples) >= LATENCY_MIN_SAMPLES and self.recorded % LATENCY_REFRESH == 0:
+                ordered = sorted(self.samples)
+                value = ordered[min(len(ordered) - 1, int(len(ordered) * self.percentile / 100))]
+                timeout = max(value * self.factor, TIMEOUT_MIN)
+                self.current = (min(timeout, self.connect_limit), min(timeout, self.read_limit))
+
+    # A timed out request took at least the current limit; leaving it out would only let the limit shrink
+    def record_timeout(self):
+        self.record(max(self.current))
+
+    def timeouts(self):
+        return self.current
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    # Takes a token now and returns how long the caller has to wait before using it
+    def reserve(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        return max(0.0, -self.tokens / self.rate)
+
+    def defer(self, now, seconds):
+        self.reserve(now)
+        self.tokens = min(self.tokens, -seconds * self.rate)
+
+    def idle(self, now):
+        return self.tokens + (now - self.updated) * self.rate >= self.burst
+
+class RateLimiter:
+    """Token buckets per host and per registered domain."""
+
+    def __init__(self, host_rate=HOST_RATE, domain_rate=DOMAIN_RATE, burst=RATE_BURST):
+        self.host_rate = host_rate
+        self.domain_rate = domain_rate
+        self.burst = burst
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def _bucket(self, key, rate):
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = TokenBucket(rate, self.burst)
+        return bucket
+
+    def _prune(self, now):
+        if len(self.buckets) > RATE_MAX_BUCKETS:
+            for key in [key for key, bucket in self.buckets.items() if bucket.idle(now)]:
+                del self.buckets[key]
+
+    def delay(self, host):
+        if not host:
+            return 0.0
+        with self.lock:
+            now = time.monotonic()
+            self._prune(now)
+            wait = 0.0
+            if self.host_rate > 0:
+                wait = max(wait, self._bucket(('host', host), self.host_rate).reserve(now))
+            if self.domain_rate > 0:
+                wait = max(wait, self._bucket(('domain', registered_domain(host)), self.domain_rate).reserve(now))
+            return wait
+
+    def defer(self, host, seconds):
+        if host and self.host_rate > 0:
+            with self.lock:
+                self._bucket(('host', host), self.host_rate).defer(time.monotonic(), seconds)
+
+class DeferredQueue:
+    """Hands out items once their rate limit allows, parking the others in a heap instead of a worker."""
+
+    def __init__(self, items, delay=None, limit=STREAM_WINDOW):
+        self.items = iter(items)
+        self.delay = delay
+        self.limit = limit
+        self.deferred = []
+        self.order = itertools.count()
+
+    # Returns (item, None) for an item that may start now, (None, seconds) to wait for one, or (None, None) when drained
+    def next(self):
+        now = time.monotonic()
+        if self.deferred and self.deferred[0][0] <= now:
+            return heapq.heappop(self.deferred)[2], None
+        while self.items is not None and len(self.deferred) < self.limit:
+            item = next(self.items, self)
+            if item is self:
+                self.items = None
+                break
+            delay = self.delay(item) if self.delay else 0.0
+            if delay <= 0:
+                return item, None
+            heapq.heappush(self.deferred, (time.monotonic() + delay, next(self.order), item))
+        if self.deferred:
+            return None, max(self.deferred[0][0] - time.monotonic(), 0.0)
+        return None, None
+
+class Scheduler:
+    def __init__(self, latency=None, limiter=None, retries=MAX_RETRIES):
+        self.latency = latency or LatencyTracker()
+        self.limiter = limiter or RateLimiter()
+        self.retries = retries
+
+    # Returns the seconds to wait before retrying, or None when the result is final
+    def retry_after(self, host, status_code, headers, attempt):
+        if status_code != 429 or attempt >= self.retries:
+            return None
+        seconds = parse_retry_after(headers.get('Retry-After'))
+        if seconds is None or seconds > MAX_RETRY_AFTER:
+            return None
+        self.limiter.defer(host, seconds)
+        return seconds
+
+    # Reserves the first attempt of a domain, so the caller can defer it rather than sleep
+    def pace(self, domain):
+        return self.limiter.delay(urlparse(domain).hostname)
+
+def registered_domain(host):
+    # Addresses have no registered domain, each one is its own bucket
+    if dns_cache.is_ip_address(host):
+        return host
+    labels = host.rstrip('.').split('.')
+    # Good enough for the usual ccTLD second levels such as example.co.uk, without a public suffix list
+    if len(labels) > 2 and len(labels[-1]) == 2 and labels[-2] in SECOND_LEVEL_LABELS:
+        return '.'.join(labels[-3:])
+    return '.'.join(labels[-2:])
+
+def parse_retry_after(value):
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+def new_record(domain):
+    return {
+        'domain': domain,
+        'status': None,
+        'error_class': None,
+        'error': None,
+        'redirects': 0,
+        'final_url': None,
+        'attempts': 0,
+        'timings': dict.fromkeys(TIMING_NAMES),
     }
+
+def set_error(record, label, error):
+    record['error_class'] = type(error).__name__
+    record['error'] = f"{label} occurred: {str(error)}"
+
+# The status text the good/bad files and the journal have always used
+def record_status(record):
+    return record['status'] if record['error'] is None else record['error']
+
+def dns_record(domain, error):
+    record = new_record(domain)
+    record['error_class'] = 'DNSError'
+    record['error'] = error
+    return record
+
+def round_timings(timings):
+    for name, value in timings.items():
+        if value is not None:
+            timings[name] = round(value, 4)
+
+def timed_resolve(host):
+    if not host or dns_cache.is_ip_address(host):
+        return None
+    start = time.monotonic()
+    dns_cache.resolve(host)
+    return time.monotonic() - start
+
+thread_sessions = threading.local()
+
+# Sessions are not safe to share between threads, so every worker thread keeps its own keep-alive pool
+def thread_session():
+    session = getattr(thread_sessions, 'session', None)
+    if session is None:
+        session = thread_sessions.session = requests.Session()
+    return session
+
+def fetch_response(session, domain, probe, timeout, timings):
+    start = time.monotonic()
+    if probe == 'head':
+        response = session.head(domain, headers=HEADERS, timeout=timeout, allow_redirects=True)
+        if response.status_code in HEAD_REJECTED_STATUS:
+            # Streamed GET: closing it drops the connection right after the status line and headers
+            with session.get(domain, headers=HEADERS, timeout=timeout, allow_redirects=True, stream=True) as response:
+                pass
+        timings['ttfb'] = time.monotonic() - start
+        return response
+
+    response = session.get(domain, headers=HEADERS, timeout=timeout, allow_redirects=True, stream=True)
+    timings['ttfb'] = time.monotonic() - start
+    # Read the body so the connection can go back to the pool
+    response.content
+    return response
+
+# With paced=True the caller has already reserved the first attempt through Scheduler.pace
+def probe_domain(domain, probe='get', scheduler=None, paced=False):
+    record = new_record(domain)
+    timings = record['timings']
+    host = urlparse(domain).hostname
+    start = time.monotonic()
+    waited = 0.0
+
     try:
-        response = requests.get(domain, headers=headers, timeout=(TIMEOUT_CONNECT, TIMEOUT_READ), allow_redirects=True)
-        return domain, response.status_code
+        try:
+            timings['dns'] = timed_resolve(host)
+        except socket.gaierror as e:
+            if e.errno in dns_cache.NEGATIVE_ERRORS:
+                return dns_record(domain, f"DNS error occurred: {str(e)}")
+
+        while True:
+            timeout = (TIMEOUT_CONNECT, TIMEOUT_READ)
+            if scheduler is not None:
+                if record['attempts'] or not paced:
+                    delay = scheduler.limiter.delay(host)
+                    time.sleep(delay)
+                    waited += delay
+                timeout = scheduler.latency.timeouts()
+
+            record['attempts'] += 1
+            response = fetch_response(thread_session(), domain, probe, timeout, timings)
+            wait = None
+            if scheduler is not None:
+                scheduler.latency.record(timings['ttfb'])
+                wait = scheduler.retry_after(host, response.status_code, response.headers, record['attempts'] - 1)
+            if wait is None:
+                break
+            time.sleep(wait)
+            waited += wait
+
+        record['status'] = response.status_code
+        record['final_url'] = response.url
+        record['redirects'] = len(response.history)
     except requests.Timeout as e:
-        return domain, f"Timeout occurred: {str(e)}"
+        if scheduler is not None:
+            scheduler.latency.record_timeout()
+        set_error(record, "Timeout", e)
     except requests.HTTPError as e:
-        return domain, f"HTTP error occurred: {str(e)}"
+        set_error(record, "HTTP error", e)
     except requests.RequestException as e:
-        return domain, f"Other error occurred: {str(e)}"
+        set_error(record, "Other error", e)
+    finally:
+        timings['wait'] = waited
+        timings['total'] = time.monotonic() - start
+        round_timings(timings)
+    return record
 
-def read_domains_from_file(domain_file):
+def check_domain(domain, probe='get', scheduler=None):
+    record = probe_domain(domain, probe, scheduler)
+    return domain, record_status(record)
+
+# Collects per-request DNS, connection and header timings from aiohttp's tracing hooks
+def timing_trace_config():
+    trace_config = aiohttp.TraceConfig()
+
+    def started(name):
+        async def on_start(session, context, params):
+            if context.trace_request_ctx is not None:
+                context.trace_request_ctx['_' + name] = time.monotonic()
+        return on_start
+
+    def finished(name):
+        async def on_end(session, context, params):
+            marks = context.trace_request_ctx
+            if marks is not None and '_' + name in marks:
+                marks[name] = marks.get(name, 0.0) + time.monotonic() - marks.pop('_' + name)
+        return on_end
+
+    trace_config.on_dns_resolvehost_start.append(started('dns'))
+    trace_config.on_dns_resolvehost_end.append(finished('dns'))
+    trace_config.on_connection_create_start.append(started('connect'))
+    trace_config.on_connection_create_end.append(finished('connect'))
+    trace_config.on_request_start.append(started('ttfb'))
+    trace_config.on_request_end.append(finished('ttfb'))
+    return trace_config
+
+async def fetch_response_async(session, domain, probe, marks, timeout=None):
+    options = {'allow_redirects': True, 'trace_request_ctx': marks}
+    # Without an explicit timeout the session-wide one applies
+    if timeout:
+        options['timeout'] = timeout
+    if probe == 'head':
+        async with session.head(domain, **options) as response:
+            if response.status not in HEAD_REJECTED_STATUS:
+                return response
+        async with session.get(domain, **options) as response:
+            # Only the status line and headers are needed, don't pool a half-read connection
+            response.close()
+            return response
+
+    async with session.get(domain, **options) as response:
+        # Drain the raw body so the connection goes back to the pool
+        async for _ in response.content.iter_chunked(65536):
+            pass
+        return response
+
+async def probe_domain_async(session, domain, probe='get', scheduler=None, paced=False):
+    record = new_record(domain)
+    timings = record['timings']
+    host = urlparse(domain).hostname
+    start = time.monotonic()
+    waited = 0.0
+    marks = {}
+
+    try:
+        while True:
+            timeout = None
+            if scheduler is not None:
+                if record['attempts'] or not paced:
+                    delay = scheduler.limiter.delay(host)
+                    await asyncio.sleep(delay)
+                    waited += delay
+                connect, read = scheduler.latency.timeouts()
+                timeout = aiohttp.ClientTimeout(sock_connect=connect, sock_read=read)
+
+            record['attempts'] += 1
+            marks = {}
+            response = await fetch_response_async(session, domain, probe, marks, timeout)
+            wait = None
+            if scheduler is not None:
+                scheduler.latency.record(marks.get('ttfb', 0.0))
+                wait = scheduler.retry_after(host, response.status, response.headers, record['attempts'] - 1)
+            if wait is None:
+                break
+            await asyncio.sleep(wait)
+            waited += wait
+
+        record['status'] = response.status
+        record['final_url'] = str(response.url)
+        record['redirects'] = len(response.history)
+    except asyncio.TimeoutError as e:
+        if scheduler is not None:
+            scheduler.latency.record_timeout()
+        set_error(record, "Timeout", e)
+    except aiohttp.ClientResponseError as e:
+        set_error(record, "HTTP error", e)
+    except (aiohttp.ClientError, ValueError) as e:
+        set_error(record, "Other error", e)
+    finally:
+        timings['dns'] = marks.get('dns')
+        # aiohttp reports connection setup as one span that includes DNS and the TLS handshake
+        if 'connect' in marks:
+            timings['connect'] = marks['connect'] - (marks.get('dns') or 0.0)
+        timings['ttfb'] = marks.get('ttfb')
+        timings['wait'] = waited
+        timings['total'] = time.monotonic() - start
+        round_timings(timings)
+    return record
+
+async def check_domain_async(session, domain, probe='get', scheduler=None):
+    record = await probe_domain_async(session, domain, probe, scheduler)
+    return domain, record_status(record)
+
+def iter_domains_from_file(domain_file):
     with open(domain_file, 'r') as file:
-        return [domain.strip() for domain in file.readlines()]
+        for line in file:
+            domain = line.strip()
+            if domain:
+                yield domain
 
-def check_domains(domain_file):
-    domains = read_domains_from_file(domain_file)
-    total_domains = len(domains)
+def read_domains_from_file(domain_file):
+    return list(iter_domains_from_file(domain_file))
+
+def count_domains(domain_file):
+    return sum(1 for _ in iter_domains_from_file(domain_file))
+
+def progress_printer(total_domains):
     domains_checked = 0
-    results = {}
     progress_interval = max(total_domains // 10, 1)
 
-    with concurrent.futures.ThreadPoolExecutor(max_workers=NUM_THREADS) as executor:
-        futures = {executor.submit(check_domain, domain): domain for domain in domains}
-        for future in concurrent.futures.as_completed(futures):
+    def report():
+        nonlocal domains_checked
+        domains_checked += 1
+        if domains_checked % progress_interval == 0 or domains_checked == total_domains:
+            progress = domains_checked / max(total_domains, 1) * 100
+            sys.stdout.write(f"\rDomains Checked: {domains_checked}/{total_domains} [{progress:.2f}%]")
+            sys.stdout.flush()
+    return report
+
+# Keep at most `window` items in flight so memory stays flat on huge inputs
+def iter_completed(executor, fn, items, window, delay=None):
+    queue = DeferredQueue(items, delay, window)
+    in_flight = {}
+
+    while True:
+        wait = None
+        while len(in_flight) < window:
+            item, wait = queue.next()
+            if item is None:
+                break
+            in_flight[executor.submit(fn, item)] = item
+        if not in_flight:
+            if wait is None:
+                return
+            time.sleep(wait)
+            continue
+
+        done, _ = concurrent.futures.wait(in_flight, timeout=wait, return_when=concurrent.futures.FIRST_COMPLETED)
+        for future in done:
+            yield in_flight.pop(future), future
+
+# Returns an error for hosts that will never resolve, None otherwise
+def dns_error(domain):
+    host = urlparse(domain).hostname
+    if not host:
+        return None
+    try:
+        dns_cache.resolve(host)
+    except socket.gaierror as e:
+        if e.errno in dns_cache.NEGATIVE_ERRORS:
+            return f"DNS error occurred: {str(e)}"
+    return None
+
+# Resolve hosts ahead of the HTTP checks; dead names are reported without opening a socket
+def pre_resolve_domains(domains, on_result, workers=DNS_THREADS):
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        for domain, future in iter_completed(executor, dns_error, domains, workers * 2):
+            try:
+                error = future.result()
+            except Exception:
+                error = None
+            if error:
+                on_result(dns_record(domain, error))
+            else:
+                yield domain
+
+def run_checks(domains, on_result, workers=NUM_THREADS, window=STREAM_WINDOW, probe='get', scheduler=None):
+    pace = scheduler.pace if scheduler is not None else None
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        for domain, future in iter_completed(executor, lambda domain: probe_domain(domain, probe, scheduler, paced=pace is not None), domains, max(window, workers), pace):
             try:
-                result = future.result()
-                results[result[0]] = result[1]
+                record = future.result()
             except Exception as e:
-                results[futures[future]] = str(e)
+                record = new_record(domain)
+                set_error(record, "Other error", e)
+            on_result(record)
+
+async def run_checks_async(domains, on_result, concurrency=ASYNC_CONCURRENCY, per_host=ASYNC_PER_HOST, probe='get', pre_resolve=False, dns_threads=DNS_THREADS, scheduler=None):
+    if aiohttp is None:
+        raise RuntimeError("The async engine requires aiohttp (pip install aiohttp).")
+
+    # Workers pull from the same queue, so only `concurrency` domains are ever in flight
+    # and rate-limited ones wait in it without holding a worker
+    domains = DeferredQueue(domains, scheduler.pace if scheduler is not None else None, concurrency)
+
+    # One pooled connector for the whole run: keep-alive sockets are reused per host
+    # Lookups go through socket.getaddrinfo, so they share the process-wide TTL-aware DNS cache
+    connector = aiohttp.TCPConnector(limit=concurrency, limit_per_host=per_host, use_dns_cache=False, resolver=aiohttp.ThreadedResolver())
+    timeout = aiohttp.ClientTimeout(sock_connect=TIMEOUT_CONNECT, sock_read=TIMEOUT_READ)
+
+    loop = asyncio.get_running_loop()
+    dns_executor = concurrent.futures.ThreadPoolExecutor(max_workers=dns_threads) if pre_resolve else None
+
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout, headers=HEADERS, auto_decompress=False, trace_configs=[timing_trace_config()]) as session:
+        async def worker():
+            while True:
+                domain, wait = domains.next()
+                if domain is None:
+                    if wait is None:
+                        return
+                    await asyncio.sleep(wait)
+                    continue
+                try:
+                    error = await loop.run_in_executor(dns_executor, dns_error, domain) if pre_resolve else None
+                    record = dns_record(domain, error) if error else await probe_domain_async(session, domain, probe, scheduler, paced=scheduler is not None)
+                except Exception as e:
+                    record = new_record(domain)
+                    set_error(record, "Other error", e)
+                on_result(record)
+
+        try:
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+        finally:
+            if dns_executor is not None:
+                dns_executor.shutdown()
 
-            domains_checked += 1
-            if domains_checked % progress_interval == 0 or domains_checked == total_domains:
-                progress = domains_checked / total_domains * 100
-                sys.stdout.write(f"\rDomains Checked: {domains_checked}/{total_domains} [{progress:.2f}%]")
-                sys.stdout.flush()
+def collect_results(report):
+    results = {}
+
+    def on_result(record):
+        results[record['domain']] = record_status(record)
+        report()
+    return results, on_result
+
+def check_domains(domain_file):
+    results, on_result = collect_results(progress_printer(count_domains(domain_file)))
+    run_checks(iter_domains_from_file(domain_file), on_result)
     return results
 
+async def check_domains_async(domain_file, concurrency=ASYNC_CONCURRENCY, per_host=ASYNC_PER_HOST):
+    results, on_result = collect_results(progress_printer(count_domains(domain_file)))
+    await run_checks_async(iter_domains_from_file(domain_file), on_result, concurrency, per_host)
+    return results
+
+def is_good_status(status_code):
+    return isinstance(status_code, int) and status_code in GOOD_STATUS
+
 def filter_domains(results):
     working_domains = {}
     not_working_domains = {}
     for domain, status_code in results.items():
-        if isinstance(status_code, int) and status_code in GOOD_STATUS:
+        if is_good_status(status_code):
             working_domains[domain] = status_code
         else:
             not_working_domains[domain] = status_code
     return working_domains, not_working_domains
 
-def save_results_to_file(results):
-    working_domains, not_working_domains = results
-    output_folder = 'result'
+class RunStats:
+    """Status and error histograms plus sampled timings for the end-of-run summary."""
+
+    def __init__(self, sample_size=SUMMARY_SAMPLE_SIZE):
+        self.started = time.monotonic()
+        self.checked = 0
+        self.good = 0
+        self.statuses = collections.Counter()
+        self.error_classes = collections.Counter()
+        self.sample_size = sample_size
+        self.samples = {name: [] for name in TIMING_NAMES}
+        self.seen = dict.fromkeys(TIMING_NAMES, 0)
+
+    def add(self, record):
+        self.checked += 1
+        self.good += is_good_status(record_status(record))
+        self.statuses[str(record['status']) if record['status'] is not None else 'error'] += 1
+        if record['error_class']:
+            self.error_classes[record['error_class']] += 1
+
+        # Reservoir sampling keeps the percentiles honest without holding every timing
+        for name, value in record['timings'].items():
+            if value is None or name not in self.samples:
+                continue
+            self.seen[name] += 1
+            samples = self.samples[name]
+            if len(samples) < self.sample_size:
+                samples.append(value)
+            else:
+                slot = random.randrange(self.seen[name])
+                if slot < self.sample_size:
+                    samples[slot] = value
+
+    def summary(self):
+        duration = time.monotonic() - self.started
+        latency = {}
+        for name, samples in self.samples.items():
+            if samples:
+                ordered = sorted(samples)
+                latency[name] = {f"p{p}": round(ordered[min(len(ordered) - 1, len(ordered) * p // 100)], 4) for p in SUMMARY_PERCENTILES}
+        return {
+            'checked': self.checked,
+            'good': self.good,
+            'bad': self.checked - self.good,
+            'duration': round(duration, 3),
+            'throughput': round(self.checked / duration, 2) if duration else 0.0,
+            'statuses': dict(self.statuses.most_common()),
+            'error_classes': dict(self.error_classes.most_common()),
+            'latency': latency,
+        }
+
+def print_summary(summary):
+    print(f"\nChecked {summary['checked']} domains in {summary['duration']:.1f}s ({summary['throughput']:.1f} domains/s), {summary['good']} good, {summary['bad']} bad")
+    print("Statuses: " + ", ".join(f"{status}={count}" for status, count in summary['statuses'].items()))
+    if summary['error_classes']:
+        print("Errors: " + ", ".join(f"{name}={count}" for name, count in summary['error_classes'].items()))
+    for name, percentiles in summary['latency'].items():
+        print(f"{name:>7}: " + " ".join(f"{p}={value * 1000:.0f}ms" for p, value in percentiles.items()))
+
+def result_file_paths(output_folder='result', current_datetime=None):
     if not os.path.exists(output_folder):
         os.makedirs(output_folder)
 
-    current_datetime = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    current_datetime = current_datetime or datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
     output_good_domains = os.path.join(output_folder, f'output_good_{current_datetime}.txt')
     output_bad_domains = os.path.join(output_folder, f'output_bad_{current_datetime}.txt')
+    return output_good_domains, output_bad_domains
+
+def save_results_to_file(results):
+    working_domains, not_working_domains = results
+    output_folder = 'result'
+    output_good_domains, output_bad_domains = result_file_paths(output_folder)
 
     with open(output_good_domains, 'w') as file:
         file.write("\n".join(working_domains.keys()))
@@ -85,14 +690,272 @@ def save_results_to_file(results):
             file.write(f"{domain}\n")
     print(f"\nDomain check results saved in the '{output_folder}' folder.")
 
+# Journal of every completed domain, so an interrupted sweep can be resumed
+def open_checkpoint(checkpoint_file, resume=False):
+    checkpoint_folder = os.path.dirname(checkpoint_file)
+    if checkpoint_folder and not os.path.exists(checkpoint_folder):
+        os.makedirs(checkpoint_folder)
+
+    journal = sqlite3.connect(checkpoint_file, timeout=30)
+    journal.execute("PRAGMA journal_mode=WAL")
+    journal.execute("CREATE TABLE IF NOT EXISTS checked (domain TEXT PRIMARY KEY, status TEXT NOT NULL, good INTEGER NOT NULL, record TEXT)")
+    # Journals written before structured results have no record column
+    if 'record' not in [column[1] for column in journal.execute("PRAGMA table_info(checked)")]:
+        journal.execute("ALTER TABLE checked ADD COLUMN record TEXT")
+    if not resume:
+        journal.execute("DELETE FROM checked")
+    journal.commit()
+    return journal
+
+def record_checkpoint(journal, record):
+    status_code = record_status(record)
+    journal.execute("INSERT OR REPLACE INTO checked (domain, status, good, record) VALUES (?, ?, ?, ?)",
+                    (record['domain'], str(status_code), int(is_good_status(status_code)), json.dumps(record)))
+
+def is_checked(journal, domain):
+    return journal.execute("SELECT 1 FROM checked WHERE domain = ?", (domain,)).fetchone() is not None
+
+def replay_checkpoint(journal, good_file, bad_file, record_file):
+    replayed = 0
+    for domain, status, good, record in journal.execute("SELECT domain, status, good, record FROM checked"):
+        (good_file if good else bad_file).write(f"{domain}\n")
+        if record is None:
+            legacy = new_record(domain)
+            if status.isdigit():
+                legacy['status'] = int(status)
+            else:
+                legacy['error'] = status
+            record = json.dumps(legacy)
+        record_file.write(record + "\n")
+        replayed += 1
+    return replayed
+
+def open_result_files(output_good_domains, output_bad_domains, output_records):
+    return (open(output_good_domains, 'a', buffering=1),
+            open(output_bad_domains, 'a', buffering=1),
+            open(output_records, 'a', buffering=1))
+
+# Append every result as soon as it completes so a crash keeps everything checked so far
+def write_results(domains, run, result_files, journal=None, stats=None, report=None):
+    good_file, bad_file, record_file = result_files
+    pending_commits = 0
+
+    def on_result(record):
+        nonlocal pending_commits
+        (good_file if is_good_status(record_status(record)) else bad_file).write(f"{record['domain']}\n")
+        record_file.write(json.dumps(record) + "\n")
+        if stats is not None:
+            stats.add(record)
+        if journal is not None:
+            record_checkpoint(journal, record)
+            pending_commits += 1
+            if pending_commits >= CHECKPOINT_EVERY:
+                journal.commit()
+                pending_commits = 0
+        if report is not None:
+            report()
+
+    try:
+        run(domains, on_result)
+    finally:
+        if journal is not None:
+            journal.commit()
+
+def finish_run(stats, output_folder, current_datetime):
+    summary = stats.summary()
+    with open(os.path.join(output_folder, f'summary_{current_datetime}.json'), 'w') as file:
+        json.dump(summary, file, indent=2)
+    print_summary(summary)
+    print(f"\nDomain check results saved in the '{output_folder}' folder.")
+
+def stream_results_to_file(domain_file, run, output_folder='result', checkpoint_file=None, resume=False):
+    total_domains = count_domains(domain_file)
+    current_datetime = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    output_good_domains, output_bad_domains = result_file_paths(output_folder, current_datetime)
+    output_records = os.path.join(output_folder, f'output_{current_datetime}.jsonl')
+    journal = open_checkpoint(checkpoint_file, resume) if checkpoint_file else None
+    stats = RunStats()
+
+    try:
+        result_files = open_result_files(output_good_domains, output_bad_domains, output_records)
+        try:
+            domains = iter_domains_from_file(domain_file)
+            if journal is not None and resume:
+                replayed = replay_checkpoint(journal, *result_files)
+                print(f"Resuming: {replayed} domains already checked.")
+                total_domains = max(total_domains - replayed, 0)
+                domains = (domain for domain in domains if not is_checked(journal, domain))
+            write_results(domains, run, result_files, journal, stats, progress_printer(total_domains))
+        finally:
+            for file in result_files:
+                file.close()
+    finally:
+        if journal is not None:
+            journal.close()
+    finish_run(stats, output_folder, current_datetime)
+
+# Hashing by host keeps every URL of a host in one process, so its connections are still reused
+def shard_of(domain, shards):
+    host = (urlparse(domain).hostname or domain).lower()
+    return zlib.crc32(host.encode()) % shards
+
+shard_progress = None
+
+def init_shard_worker(counter):
+    global shard_progress
+    shard_progress = counter
+
+def count_shard_progress():
+    with shard_progress.get_lock():
+        shard_progress.value += 1
+
+def shard_checkpoint(checkpoint_file, shard):
+    return f"{checkpoint_file}.shard{shard}"
+
+# Folds the shard journals into the main one and removes them, including those of an interrupted sweep
+def merge_shard_checkpoints(journal, checkpoint_file):
+    merged = 0
+    prefix = checkpoint_file + '.shard'
+    for path in glob.glob(glob.escape(prefix) + '*'):
+        if not path[len(prefix):].isdigit():
+            continue
+        journal.execute("ATTACH DATABASE ? AS shard", (path,))
+        try:
+            merged += journal.execute("INSERT OR REPLACE INTO checked (domain, status, good, record) SELECT domain, status, good, record FROM shard.checked").rowcount
+            journal.commit()
+        finally:
+            journal.execute("DETACH DATABASE shard")
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+    return merged
+
+# Each shard journals to its own file, the shared checkpoint is only read so shards never wait on its write lock
+def run_shard(args, shard, shards, shard_folder):
+    dns_cache.install()
+    run = build_runner(args)
+    journal = open_checkpoint(shard_checkpoint(args.checkpoint, shard)) if args.checkpoint else None
+    checked = sqlite3.connect(args.checkpoint, timeout=30) if args.checkpoint and args.resume else None
+    output_good_domains, output_bad_domains = result_file_paths(shard_folder, f'shard_{shard}')
+    output_records = os.path.join(shard_folder, f'output_shard_{shard}.jsonl')
+
+    try:
+        domains = (domain for domain in iter_domains_from_file(args.file) if shard_of(domain, shards) == shard)
+        if checked is not None:
+            domains = (domain for domain in domains if not is_checked(checked, domain))
+        result_files = open_result_files(output_good_domains, output_bad_domains, output_records)
+        try:
+            write_results(domains, run, result_files, journal, report=count_shard_progress)
+        finally:
+            for file in result_files:
+                file.close()
+    finally:
+        for connection in (journal, checked):
+            if connection is not None:
+                connection.close()
+    return output_good_domains, output_bad_domains, output_records
+
+def sharded_sweep(args, output_folder='result'):
+    shards = args.workers
+    total_domains = count_domains(args.file)
+    current_datetime = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    output_good_domains, output_bad_domains = result_file_paths(output_folder, current_datetime)
+    output_records = os.path.join(output_folder, f'output_{current_datetime}.jsonl')
+    shard_folder = os.path.join(output_folder, f'shards_{current_datetime}')
+    stats = RunStats()
+
+    # The parent owns the journal reset, replay and merge; the shards only read it
+    if args.checkpoint:
+        journal = open_checkpoint(args.checkpoint, args.resume)
+        if args.resume:
+            merge_shard_checkpoints(journal, args.checkpoint)
+            result_files = open_result_files(output_good_domains, output_bad_domains, output_records)
+            try:
+                replayed = replay_checkpoint(journal, *result_files)
+            finally:
+                for file in result_files:
+                    file.close()
+            print(f"Resuming: {replayed} domains already checked.")
+            total_domains = max(total_domains - replayed, 0)
+        journal.close()
+
+    counter = multiprocessing.Value('q', 0)
+    report = progress_printer(total_domains)
+    reported = 0
+    try:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=shards, initializer=init_shard_worker, initargs=(counter,)) as executor:
+            futures = [executor.submit(run_shard, args, shard, shards, shard_folder) for shard in range(shards)]
+            pending = set(futures)
+            while pending:
+                _, pending = concurrent.futures.wait(pending, timeout=1)
+                for _ in range(counter.value - reported):
+                    report()
+                reported = counter.value
+            shard_files = [future.result() for future in futures]
+    finally:
+        if args.checkpoint:
+            journal = open_checkpoint(args.checkpoint, resume=True)
+            try:
+                merge_shard_checkpoints(journal, args.checkpoint)
+            finally:
+                journal.close()
+
+    # Merge shard outputs into the usual result/ layout and build the summary from the records
+    with open(output_good_domains, 'a') as good_file, open(output_bad_domains, 'a') as bad_file, open(output_records, 'a') as record_file:
+        for shard_good, shard_bad, shard_records in shard_files:
+            for source, target in ((shard_good, good_file), (shard_bad, bad_file)):
+                with open(source) as file:
+                    shutil.copyfileobj(file, target)
+            with open(shard_records) as file:
+                for line in file:
+                    record_file.write(line)
+                    stats.add(json.loads(line))
+    shutil.rmtree(shard_folder, ignore_errors=True)
+    finish_run(stats, output_folder, current_datetime)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Check which domains are reachable")
+    parser.add_argument("-f", "--file", default="domains.txt", help="File with one URL per line (default: domains.txt)")
+    parser.add_argument("--engine", choices=["threads", "async"], default="threads", help="Checker engine (default: threads)")
+    parser.add_argument("--window", type=int, default=STREAM_WINDOW, help=f"Domains in flight for the threads engine (default: {STREAM_WINDOW})")
+    parser.add_argument("--concurrency", type=int, default=ASYNC_CONCURRENCY, help=f"Requests in flight for the async engine (default: {ASYNC_CONCURRENCY})")
+    parser.add_argument("--per-host", type=int, default=ASYNC_PER_HOST, help=f"Pooled connections per host for the async engine (default: {ASYNC_PER_HOST})")
+    parser.add_argument("--probe", choices=["get", "head"], default="get", help="Probe with a full GET, or HEAD first with a header-only GET fallback on 405/501 (default: get)")
+    parser.add_argument("--pre-resolve", action="store_true", help="Resolve hosts concurrently first and mark dead names as bad without connecting")
+    parser.add_argument("--dns-threads", type=int, default=DNS_THREADS, help=f"Threads for the pre-resolution stage (default: {DNS_THREADS})")
+    parser.add_argument("--slo", type=float, help="Upper bound in seconds for connect plus read timeouts of a single request, enables adaptive timeouts")
+    parser.add_argument("--adaptive-timeouts", action="store_true", help=f"Derive timeouts from observed latency instead of the fixed {TIMEOUT_CONNECT:g}s connect and {TIMEOUT_READ:g}s read limits")
+    parser.add_argument("--host-rate", type=float, default=HOST_RATE, help="Requests per second per host, e.g. 5 to stay polite on host-sorted lists (default: unlimited)")
+    parser.add_argument("--domain-rate", type=float, default=DOMAIN_RATE, help="Requests per second per registered domain (default: unlimited)")
+    parser.add_argument("--retries", type=int, default=MAX_RETRIES, help=f"Retries for 429 responses with Retry-After (default: {MAX_RETRIES})")
+    parser.add_argument("--workers", type=int, default=1, help="Processes to shard the sweep across, hashed by host (default: 1)")
+    parser.add_argument("--checkpoint", default=CHECKPOINT_FILE, help=f"Checkpoint journal of completed domains (default: {CHECKPOINT_FILE})")
+    parser.add_argument("--resume", action="store_true", help="Skip domains already in the checkpoint journal and merge their results")
+    return parser.parse_args()
+
+def build_runner(args):
+    scheduler = Scheduler(LatencyTracker(slo=args.slo, adaptive=args.adaptive_timeouts or args.slo is not None), RateLimiter(args.host_rate, args.domain_rate), args.retries)
+    if args.engine == "async":
+        return lambda domains, on_result: asyncio.run(run_checks_async(domains, on_result, args.concurrency, args.per_host, args.probe, args.pre_resolve, args.dns_threads, scheduler))
+    if args.pre_resolve:
+        return lambda domains, on_result: run_checks(pre_resolve_domains(domains, on_result, args.dns_threads), on_result, window=args.window, probe=args.probe, scheduler=scheduler)
+    return lambda domains, on_result: run_checks(domains, on_result, window=args.window, probe=args.probe, scheduler=scheduler)
+
 def main():
-    domain_file = 'domains.txt'
+    args = parse_args()
+    domain_file = args.file
+    dns_cache.install()
 
     try:
-        filtered_results = filter_domains(check_domains(domain_file))
-        save_results_to_file(filtered_results)
+        if args.workers > 1:
+            sharded_sweep(args)
+        else:
+            stream_results_to_file(domain_file, build_runner(args), checkpoint_file=args.checkpoint, resume=args.resume)
     except FileNotFoundError:
         print(f"File '{domain_file}' not found.")
+    except RuntimeError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,86 @@
+# pip install requests aiohttp
+# Compare the thread-pool and async engines of check_urls.py against a local HTTP stand-in
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import check_urls
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    delay = 0.0
+    body = b"<html><body>ok</body></html>"
+
+    def do_GET(self):
+        if self.delay:
+            time.sleep(self.delay)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html")
+        self.send_header("Content-Length", str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_servers(count, delay, body_size):
+    StandInHandler.delay = delay
+    StandInHandler.body = b"x" * body_size
+    servers = []
+    for _ in range(count):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+    return servers
+
+def write_domain_file(servers, requests_count):
+    hosts = [f"http://127.0.0.1:{server.server_address[1]}" for server in servers]
+    fd, path = tempfile.mkstemp(prefix="check_urls_bench_", suffix=".txt")
+    with os.fdopen(fd, "w") as file:
+        # check_domains keys results by URL, so every line has to be unique
+        for i in range(requests_count):
+            file.write(f"{hosts[i % len(hosts)]}/page/{i}\n")
+    return path
+
+def run_engine(name, runner, requests_count):
+    start = time.perf_counter()
+    results = runner()
+    elapsed = time.perf_counter() - start
+    good, bad = check_urls.filter_domains(results)
+    sys.stdout.write("\n")
+    print(f"{name:<8} {requests_count} requests in {elapsed:.2f}s -> {requests_count / elapsed:.0f} req/s ({len(good)} good, {len(bad)} bad)")
+    return requests_count / elapsed
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark check_urls.py engines against a local HTTP stand-in")
+    parser.add_argument("-n", "--requests", type=int, default=2000, help="Number of URLs to check (default: 2000)")
+    parser.add_argument("--hosts", type=int, default=4, help="Number of local stand-in hosts (default: 4)")
+    parser.add_argument("--delay", type=float, default=0.02, help="Server-side latency per request in seconds (default: 0.02)")
+    parser.add_argument("--body-size", type=int, default=2048, help="Response body size in bytes (default: 2048)")
+    parser.add_argument("--concurrency", type=int, default=check_urls.ASYNC_CONCURRENCY, help="Async engine concurrency")
+    parser.add_argument("--per-host", type=int, default=check_urls.ASYNC_PER_HOST, help="Async engine connections per host")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    servers = start_servers(args.hosts, args.delay, args.body_size)
+    domain_file = write_domain_file(servers, args.requests)
+
+    try:
+        threads_rate = run_engine("threads", lambda: check_urls.check_domains(domain_file), args.requests)
+        async_rate = run_engine("async", lambda: asyncio.run(check_urls.check_domains_async(domain_file, args.concurrency, args.per_host)), args.requests)
+        print(f"Speedup: {async_rate / threads_rate:.1f}x")
+    finally:
+        os.remove(domain_file)
+        for server in servers:
+            server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -4,14 +4,17 @@
 import os
 import sys
 from bs4 import BeautifulSoup
+from lib import file_reader
 
 def find_words(file_path, words):
-    with open(file_path, 'r', encoding='utf-8') as file:
-        html_content = file.read()
-        soup = BeautifulSoup(html_content, 'html.parser')
-        for word in words:
-            if soup.find(string=lambda text: text and word in text):
-                return True
+    # Binaries and oversized files are never parsed, so they are never deleted either
+    html_content = file_reader.read_text(file_path)
+    if html_content is None:
+        return False
+    soup = BeautifulSoup(html_content, 'html.parser')
+    for word in words:
+        if soup.find(string=lambda text: text and word in text):
+            return True
     return False
 
 def delete_files_with_words(directory, words):
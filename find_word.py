@@ -1,38 +1,365 @@
 import os
 import argparse
+import collections
+import concurrent.futures
 import fnmatch
+import functools
+import itertools
+import mmap
+import re
+import sqlite3
+from lib import file_reader
+
+MMAP_THRESHOLD = 1024 * 1024
+CHUNKSIZE = 64
+GLOB_CHARS = set('*?[')
+INDEX_MAX_SIZE = 64 * 1024 * 1024
+INDEX_CHUNK = 1024 * 1024
+TRIGRAM_RE = re.compile(b'(?=(...))', re.DOTALL)
+
+def parse_size(value):
+    units = {'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3}
+    value = value.strip().lower()
+    if value[-1:] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(value)
 
 def parse_arguments():
     parser = argparse.ArgumentParser(description='Search for a word in files within a directory.')
     parser.add_argument('-d', '--directory', type=str, help='Directory path to search in')
-    parser.add_argument('-w', '--word', type=str, help='Word or wildcard pattern to search for in files')
+    parser.add_argument('-w', '--word', type=str, nargs='+', help='Words or wildcard patterns to search for in files, a line matches if it contains any of them')
+    parser.add_argument('-i', '--ignore-case', action='store_true', help='Match regardless of case (ASCII letters)')
     parser.add_argument('-e', '--extensions', nargs='+', default=['.html', '.txt'], help='File extensions to search within')
     parser.add_argument('-o', '--output', type=str, help='Output file path to save results')
     parser.add_argument('-r', '--recursive', action='store_true', help='Perform a recursive search within subdirectories')
+    parser.add_argument('-x', '--exclude', nargs='+', default=[], help='Glob patterns of file or directory names (or relative paths) to skip, e.g. node_modules .git')
+    parser.add_argument('--ignore-file', nargs='+', default=[], help='Names of .gitignore-style files whose rules are honoured in every directory, e.g. .gitignore')
+    parser.add_argument('--max-depth', type=int, help='How many directory levels below the directory a recursive search descends')
+    parser.add_argument('--max-size', type=parse_size, help='Skip files larger than this many bytes (K, M and G suffixes allowed)')
     parser.add_argument('-c', '--context', action='store_true', help='Display context around occurrences of the word in files')
+    parser.add_argument('--index', type=str, help='SQLite trigram index of the files, created on first use and refreshed from their mtime and size')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(), help='Number of worker processes searching files (default: CPU count)')
     return parser.parse_args()
 
-def search_word_in_files(directory, word, extensions, recursive, display_context):
-    found_files = []
-    # Determine whether to perform a recursive search
-    if recursive:
-        walk_method = os.walk(directory)
+# Glob to bytes regex source; wildcards never cross a line, so files can be searched without splitting them
+def glob_to_regex(word, group=1):
+    segments = [[]]
+    i = 0
+    while i < len(word):
+        char = word[i]
+        i += 1
+        if char == '*':
+            segments.append([])
+        elif char == '?':
+            segments[-1].append('[^\n]')
+        elif char == '[':
+            end = i + 1 if word[i:i + 1] in ('!', ']') else i
+            end = word.find(']', end)
+            if end == -1:
+                segments[-1].append('\\[')
+                continue
+            members = word[i:end].replace('\\', '\\\\')
+            if members.startswith('!'):
+                members = '^\\n' + members[1:]
+            segments[-1].append('[' + members + ']')
+            i = end + 1
+        else:
+            segments[-1].append(re.escape(char))
+    segments = [''.join(segment) for segment in segments if segment]
+    if len(segments) <= 1:
+        return ''.join(segments).encode('utf-8')
+    # Between stars every segment has a fixed length, so taking the earliest place of each one, without
+    # backtracking, finds a match whenever there is one; starting from the line start keeps it linear.
+    # (?=(...))\N is an atomic group that older Pythons understand too, `group` numbers the first one
+    head = ''.join(f'(?=([^\n]*?{segment}))\\{group + n}' for n, segment in enumerate(segments[:-1]))
+    return f'^{head}[^\n]*?{segments[-1]}'.encode('utf-8')
+
+# A line matches if it contains the pattern, so a '*' run at either end adds nothing but a rescan of the line
+# per start offset; '?*?' at an end means "at least two characters", which '??' already says
+def trim_wildcards(word):
+    head = len(word) - len(word.lstrip('*?'))
+    tail = len(word[head:]) - len(word[head:].rstrip('*?'))
+    return word[:head].replace('*', '') + word[head:len(word) - tail] + word[len(word) - tail:].replace('*', '')
+
+# A single case-sensitive literal is searched with bytes.find, anything else with one compiled alternation
+def compile_patterns(words, ignore_case=False):
+    words = [trim_wildcards(word) for word in words]
+    if len(words) == 1 and not ignore_case and not GLOB_CHARS & set(words[0]):
+        return words[0].encode('utf-8')
+    sources = []
+    for word in words:
+        sources.append(glob_to_regex(word, re.compile(b'|'.join(sources)).groups + 1))
+    return re.compile(b'|'.join(sources), re.MULTILINE | (re.IGNORECASE if ignore_case else 0))
+
+def find_match(content, matcher):
+    if isinstance(matcher, bytes):
+        start = content.find(matcher)
+        return None if start == -1 else (start, start + len(matcher))
+    match = matcher.search(content)
+    return None if match is None else match.span()
+
+# Subset of .gitignore: comments, ! negation, trailing / for directories, patterns with a / anchored to the file's directory
+def read_ignore_rules(path, base):
+    rules = []
+    try:
+        with open(path, 'r', encoding='utf-8', errors='replace') as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return rules
+    for line in lines:
+        line = line.rstrip()
+        if not line or line.startswith('#'):
+            continue
+        negate = line.startswith('!')
+        if negate:
+            line = line[1:]
+        dir_only = line.endswith('/')
+        line = line.rstrip('/')
+        if line.startswith('**/'):
+            line = line[3:]
+        anchored = '/' in line
+        rules.append((base, re.compile(fnmatch.translate(line.lstrip('/'))), negate, dir_only, anchored))
+    return rules
+
+# The last matching rule wins, like git
+def is_ignored(rules, rel_path, name, is_dir):
+    ignored = False
+    for base, pattern, negate, dir_only, anchored in rules:
+        if dir_only and not is_dir:
+            continue
+        relative = rel_path[len(base) + 1:] if base else rel_path
+        if pattern.match(relative if anchored else name):
+            ignored = not negate
+    return ignored
+
+def is_excluded(excludes, rel_path, name):
+    return any(fnmatch.fnmatch(name, exclude) or fnmatch.fnmatch(rel_path, exclude) for exclude in excludes)
+
+# Excluded and ignored directories are pruned before descending, file sizes come from the DirEntry stat cache
+# A set `cancel` event ends the walk at the next directory
+def iter_file_entries(directory, extensions, recursive, excludes=(), ignore_files=(), max_depth=None, max_size=None, cancel=None):
+    if not recursive:
+        max_depth = 0
+    extensions = tuple(extensions)
+    stack = [(directory, '', 0, [])]
+    while stack:
+        if cancel is not None and cancel.is_set():
+            return
+        path, rel_dir, depth, rules = stack.pop()
+        for ignore_file in ignore_files:
+            rules = rules + read_ignore_rules(os.path.join(path, ignore_file), rel_dir)
+        try:
+            with os.scandir(path) as scan:
+                entries = list(scan)
+        except OSError:
+            continue
+
+        for entry in entries:
+            try:
+                is_dir = entry.is_dir(follow_symlinks=False)
+                if not is_dir and not (entry.name.endswith(extensions) and entry.is_file()):
+                    continue
+                rel_path = f'{rel_dir}/{entry.name}' if rel_dir else entry.name
+                if is_excluded(excludes, rel_path, entry.name) or is_ignored(rules, rel_path, entry.name, is_dir):
+                    continue
+                if is_dir:
+                    if max_depth is None or depth < max_depth:
+                        stack.append((entry.path, rel_path, depth + 1, rules))
+                elif max_size is None or entry.stat().st_size <= max_size:
+                    yield entry
+            except OSError:
+                continue
+
+# Only the line holding the match gets decoded
+def matching_line(content, matcher):
+    match = find_match(content, matcher)
+    if match is None:
+        return None
+    start = content.rfind(b'\n', 0, match[0]) + 1
+    end = content.find(b'\n', match[1])
+    if end == -1:
+        end = len(content)
+    return content[start:end].decode('utf-8', errors='replace')
+
+search_pattern = None
+
+def init_search_worker(pattern):
+    global search_pattern
+    search_pattern = pattern
+
+def search_file(file_path, pattern=None):
+    pattern = search_pattern if pattern is None else pattern
+    try:
+        with open(file_path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size < MMAP_THRESHOLD:
+                content = f.read()
+                line = None if file_reader.is_binary(content[:file_reader.SNIFF_SIZE]) else matching_line(content, pattern)
+            else:
+                # Large files are searched through the page cache instead of being copied into memory
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as content:
+                    line = None if file_reader.is_binary(content[:file_reader.SNIFF_SIZE]) else matching_line(content, pattern)
+    except (OSError, ValueError):
+        line = None
+    return file_path, line
+
+def map_chunk(function, items):
+    return [function(item) for item in items]
+
+# Like executor.map, but only a window of chunks is queued, so results stream while the walk is still running
+def lazy_map(executor, window, function, items):
+    pending = collections.deque()
+    items = iter(items)
+    while chunk := list(itertools.islice(items, CHUNKSIZE)):
+        pending.append(executor.submit(map_chunk, function, chunk))
+        if len(pending) >= window:
+            yield from pending.popleft().result()
+    while pending:
+        yield from pending.popleft().result()
+
+# Literal stretches of a glob, lowercased like the index, any file matching the glob contains all of them
+def literal_runs(word):
+    runs = ['']
+    i = 0
+    while i < len(word):
+        char = word[i]
+        i += 1
+        if char == '[':
+            end = word.find(']', i + 1 if word[i:i + 1] in ('!', ']') else i)
+            if end != -1:
+                runs.append('')
+                i = end + 1
+                continue
+        if char in '*?':
+            runs.append('')
+        else:
+            runs[-1] += char
+    return [run.encode('utf-8').lower() for run in runs if run]
+
+def pack_trigram(trigram):
+    return int.from_bytes(trigram, 'big')
+
+def index_file(entry):
+    key, mtime_ns, size = entry
+    if size > INDEX_MAX_SIZE:
+        return key, mtime_ns, size, None
+
+    trigrams = set()
+    try:
+        with open(key, 'rb') as f:
+            tail = b''
+            while chunk := f.read(INDEX_CHUNK):
+                block = tail + chunk.lower()
+                trigrams.update(TRIGRAM_RE.findall(block))
+                tail = block[-2:]
+    except OSError:
+        return key, mtime_ns, size, None
+    return key, mtime_ns, size, [pack_trigram(trigram) for trigram in trigrams]
+
+class TrigramIndex:
+    """SQLite trigram index of file contents, so only files holding every trigram of the pattern are searched."""
+
+    def __init__(self, path):
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        # indexed = 0 marks files too large or unreadable to index, they are always searched
+        self.db.execute("CREATE TABLE IF NOT EXISTS files (id INTEGER PRIMARY KEY, path TEXT NOT NULL UNIQUE, "
+                        "mtime_ns INTEGER NOT NULL, size INTEGER NOT NULL, indexed INTEGER NOT NULL)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS trigrams (trigram INTEGER NOT NULL, file_id INTEGER NOT NULL, "
+                        "PRIMARY KEY (trigram, file_id)) WITHOUT ROWID")
+        self.db.execute("CREATE INDEX IF NOT EXISTS trigrams_by_file ON trigrams (file_id)")
+
+    # Re-reads only new files and files whose mtime or size changed, returns the walked files that still exist
+    def refresh(self, directory, entries, map_files=map):
+        known = {path: (file_id, mtime_ns, size) for file_id, path, mtime_ns, size in self.db.execute("SELECT id, path, mtime_ns, size FROM files")}
+        present = []
+        seen = set()
+        stale = []
+        for entry in entries:
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            key = os.path.abspath(entry.path)
+            present.append(entry.path)
+            seen.add(key)
+            row = known.get(key)
+            if row is None or row[1:] != (stat.st_mtime_ns, stat.st_size):
+                stale.append((key, stat.st_mtime_ns, stat.st_size))
+
+        for key, mtime_ns, size, trigrams in map_files(index_file, stale):
+            if key in known:
+                file_id = known[key][0]
+                self.db.execute("DELETE FROM trigrams WHERE file_id = ?", (file_id,))
+                self.db.execute("UPDATE files SET mtime_ns = ?, size = ?, indexed = ? WHERE id = ?", (mtime_ns, size, trigrams is not None, file_id))
+            else:
+                file_id = self.db.execute("INSERT INTO files (path, mtime_ns, size, indexed) VALUES (?, ?, ?, ?)",
+                                          (key, mtime_ns, size, trigrams is not None)).lastrowid
+            if trigrams:
+                self.db.executemany("INSERT INTO trigrams (trigram, file_id) VALUES (?, ?)", ((trigram, file_id) for trigram in trigrams))
+
+        prefix = os.path.join(os.path.abspath(directory), '')
+        for key, (file_id, _, _) in known.items():
+            if key.startswith(prefix) and key not in seen and not os.path.exists(key):
+                self.db.execute("DELETE FROM trigrams WHERE file_id = ?", (file_id,))
+                self.db.execute("DELETE FROM files WHERE id = ?", (file_id,))
+        self.db.commit()
+        return present
+
+    # Paths of the files that may match any of the words, None when a word is too short to narrow anything down
+    def candidates(self, words):
+        file_ids = set()
+        for word in words:
+            trigrams = {pack_trigram(run[i:i + 3]) for run in literal_runs(word) for i in range(len(run) - 2)}
+            if not trigrams:
+                return None
+            rows = self.db.execute(f"SELECT file_id FROM trigrams WHERE trigram IN ({','.join('?' * len(trigrams))}) "
+                                   "GROUP BY file_id HAVING COUNT(*) = ?", (*trigrams, len(trigrams)))
+            file_ids.update(file_id for (file_id,) in rows)
+        file_ids.update(file_id for (file_id,) in self.db.execute("SELECT id FROM files WHERE indexed = 0"))
+        return {path for file_id, path in self.db.execute("SELECT id, path FROM files") if file_id in file_ids}
+
+    def close(self):
+        self.db.close()
+
+def indexed_candidates(index, directory, entries, words, map_files):
+    search_index = TrigramIndex(index)
+    try:
+        file_paths = search_index.refresh(directory, entries, map_files)
+        candidates = search_index.candidates(words)
+    finally:
+        search_index.close()
+    if candidates is None:
+        return file_paths
+    return [file_path for file_path in file_paths if os.path.abspath(file_path) in candidates]
+
+def run_search(directory, words, entries, index, map_files, search):
+    if index:
+        file_paths = indexed_candidates(index, directory, entries, words, map_files)
     else:
-        walk_method = [(directory, [], files) for _, _, files in os.walk(directory)]
-    # Iterate through all files and directories in the given directory
-    for root, dirs, files in walk_method:
-        for file in files:
-            file_path = os.path.join(root, file)
-            if file.endswith(tuple(extensions)):
-                # Open the file and search for the word
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                    lines = content.split('\n')
-                    for line in lines:
-                        if fnmatch.fnmatch(line, '*' + word):
-                            found_files.append((file_path, line))
-                            break  # Stop searching the rest of the lines in the file
-    return found_files
+        file_paths = (entry.path for entry in entries)
+    return map_files(search, file_paths)
+
+# Yields (file_path, line) for every searched file, line is None when nothing matched; closing the generator cancels the search
+def iter_search(directory, word, extensions, recursive, jobs=None, ignore_case=False, index=None,
+                excludes=(), ignore_files=(), max_depth=None, max_size=None, mp_context=None, cancel=None):
+    words = [word] if isinstance(word, str) else word
+    pattern = compile_patterns(words, ignore_case)
+    entries = iter_file_entries(directory, extensions, recursive, excludes, ignore_files, max_depth, max_size, cancel)
+    if jobs == 1:
+        yield from run_search(directory, words, entries, index, map, functools.partial(search_file, pattern=pattern))
+        return
+
+    jobs = jobs or os.cpu_count()
+    executor = concurrent.futures.ProcessPoolExecutor(max_workers=jobs, mp_context=mp_context, initializer=init_search_worker, initargs=(pattern,))
+    try:
+        yield from run_search(directory, words, entries, index, functools.partial(lazy_map, executor, jobs * 4), search_file)
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+def search_word_in_files(directory, word, extensions, recursive, display_context, jobs=None, ignore_case=False, index=None,
+                         excludes=(), ignore_files=(), max_depth=None, max_size=None):
+    return [(file_path, line) for file_path, line in iter_search(directory, word, extensions, recursive, jobs, ignore_case, index,
+                                                                 excludes, ignore_files, max_depth, max_size) if line is not None]
 
 def main():
     args = parse_arguments()
@@ -47,7 +374,9 @@ def main():
         print("Error: Both directory and word arguments are required.")
         return
     
-    found_files = search_word_in_files(directory_to_search, word_to_find, extensions, recursive_search, display_context)
+    found_files = search_word_in_files(directory_to_search, word_to_find, extensions, recursive_search, display_context, args.jobs, args.ignore_case, args.index,
+                                       args.exclude, args.ignore_file, args.max_depth, args.max_size)
+    word_to_find = "', '".join(word_to_find)
     
     if output_file:
         with open(output_file, 'w') as f:
@@ -59,11 +388,8 @@ def main():
             print("Found '{}' in file: {}".format(word_to_find, file_path))
             if display_context:
                 print("Context:")
-                # Split content into lines and find the line containing the word
-                lines = content.split('\n')
-                for line in lines:
-                    if fnmatch.fnmatch(line, '*' + word_to_find + '*'):
-                        print(line)
+                # content is the line holding the first match
+                print(content)
                 print()
         print("Total files found:", len(found_files))
     else:
@@ -71,5 +397,3 @@ def main():
 
 if __name__ == "__main__":
     main()
-
-# ToDo: Exclude certain paths, parallelization
\ No newline at end of file
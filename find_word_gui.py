@@ -1,66 +1,162 @@
 # Requirement: pip install tk
 
+import multiprocessing
+import queue
+import threading
+import time
 import tkinter as tk
 from tkinter import filedialog
-import subprocess
+from tkinter import scrolledtext
+
+import find_word
+
+POLL_INTERVAL = 100
+MAX_MESSAGES_PER_POLL = 500
+PROGRESS_INTERVAL = 0.1
+
+results_queue = queue.Queue()
+cancel_event = None
+found_files = []
 
 def browse_directory():
     directory = filedialog.askdirectory()
     directory_entry.delete(0, tk.END)
     directory_entry.insert(0, directory)
 
+# Runs in a background thread, the Tk widgets are only touched from poll_results
+def search_worker(directory, word, extensions, recursive, cancel, results):
+    searched = matched = 0
+    reported = time.monotonic()
+    # Forking from this thread would copy the Tk process mid-flight, spawned workers start clean
+    search = find_word.iter_search(directory, word, extensions, recursive, mp_context=multiprocessing.get_context("spawn"), cancel=cancel)
+    try:
+        for file_path, line in search:
+            if cancel.is_set():
+                break
+            searched += 1
+            if line is not None:
+                matched += 1
+                results.put(("match", file_path, line))
+            # One progress message per poll is all the status line can show, more would only back up the queue
+            now = time.monotonic()
+            if now - reported >= PROGRESS_INTERVAL:
+                reported = now
+                results.put(("progress", searched, matched))
+    except Exception as e:
+        results.put(("error", str(e)))
+    finally:
+        # Closing the generator shuts the worker pool down and drops the queued files
+        search.close()
+        results.put(("done", searched, matched, cancel.is_set()))
+
 def run_script():
+    global cancel_event
     directory = directory_entry.get()
     word = word_entry.get()
     extensions = extensions_entry.get().split()
     recursive = recursive_var.get()
-    context = context_var.get()
-    save_to_file = save_to_file_var.get()
+
+    if not directory or not word:
+        status_var.set("Error: Both directory and word are required.")
+        return
+
+    found_files.clear()
+    results_text.delete("1.0", tk.END)
+    status_var.set("Searching...")
+    run_button.config(state=tk.DISABLED)
+    cancel_button.config(state=tk.NORMAL)
+
+    cancel_event = threading.Event()
+    threading.Thread(target=search_worker, args=(directory, word, extensions, recursive, cancel_event, results_queue), daemon=True).start()
+    root.after(POLL_INTERVAL, poll_results)
+
+def cancel_search():
+    if cancel_event is not None:
+        cancel_event.set()
+        status_var.set("Cancelling...")
+        cancel_button.config(state=tk.DISABLED)
+
+def poll_results():
+    for _ in range(MAX_MESSAGES_PER_POLL):
+        try:
+            message = results_queue.get_nowait()
+        except queue.Empty:
+            break
+
+        if message[0] == "match":
+            _, file_path, line = message
+            found_files.append(file_path)
+            results_text.insert(tk.END, f"{file_path}\n")
+            if context_var.get():
+                results_text.insert(tk.END, f"    {line}\n")
+            results_text.see(tk.END)
+        elif message[0] == "progress":
+            status_var.set(f"Searched {message[1]} files, {message[2]} matches")
+        elif message[0] == "error":
+            results_text.insert(tk.END, f"Error: {message[1]}\n")
+        elif message[0] == "done":
+            finish_search(*message[1:])
+            return
+    root.after(POLL_INTERVAL, poll_results)
+
+def finish_search(searched, matched, cancelled):
+    status = f"{'Cancelled' if cancelled else 'Done'}: searched {searched} files, {matched} matches"
     output_file = output_file_entry.get()
+    if save_to_file_var.get() and output_file:
+        with open(output_file, 'w') as f:
+            for file_path in found_files:
+                f.write(file_path + '\n')
+        status += f", saved to {output_file}"
+    status_var.set(status)
+    run_button.config(state=tk.NORMAL)
+    cancel_button.config(state=tk.DISABLED)
 
-    command = ["python3", "find_word.py", "-d", directory, "-w", word, "-e"] + extensions
-    if recursive:
-        command.append("-r")
-    if context:
-        command.append("-c")
-    if save_to_file and output_file:
-        command.extend(["-o", output_file])
+# The window is only built when run directly, so spawned search workers can import this module
+if __name__ == "__main__":
+    # Create the main window
+    root = tk.Tk()
+    root.title("Find Word Script")
 
-    subprocess.run(command)
+    # Create and place GUI elements
+    tk.Label(root, text="Directory:").grid(row=0, column=0, sticky="w")
+    directory_entry = tk.Entry(root, width=50)
+    directory_entry.grid(row=0, column=1)
+    tk.Button(root, text="Browse", command=browse_directory).grid(row=0, column=2)
 
-# Create the main window
-root = tk.Tk()
-root.title("Find Word Script")
+    tk.Label(root, text="Word or pattern:").grid(row=1, column=0, sticky="w")
+    word_entry = tk.Entry(root, width=50)
+    word_entry.grid(row=1, column=1)
 
-# Create and place GUI elements
-tk.Label(root, text="Directory:").grid(row=0, column=0, sticky="w")
-directory_entry = tk.Entry(root, width=50)
-directory_entry.grid(row=0, column=1)
-tk.Button(root, text="Browse", command=browse_directory).grid(row=0, column=2)
+    tk.Label(root, text="Extensions (space-separated):").grid(row=2, column=0, sticky="w")
+    extensions_entry = tk.Entry(root, width=50)
+    extensions_entry.insert(0, ".html .txt")
+    extensions_entry.grid(row=2, column=1)
 
-tk.Label(root, text="Word or pattern:").grid(row=1, column=0, sticky="w")
-word_entry = tk.Entry(root, width=50)
-word_entry.grid(row=1, column=1)
+    recursive_var = tk.BooleanVar()
+    tk.Checkbutton(root, text="Recursive search", variable=recursive_var).grid(row=3, column=0, sticky="w")
 
-tk.Label(root, text="Extensions (space-separated):").grid(row=2, column=0, sticky="w")
-extensions_entry = tk.Entry(root, width=50)
-extensions_entry.insert(0, ".html .txt")
-extensions_entry.grid(row=2, column=1)
+    context_var = tk.BooleanVar()
+    tk.Checkbutton(root, text="Display context", variable=context_var).grid(row=4, column=0, sticky="w")
 
-recursive_var = tk.BooleanVar()
-tk.Checkbutton(root, text="Recursive search", variable=recursive_var).grid(row=3, column=0, sticky="w")
+    save_to_file_var = tk.BooleanVar()
+    save_to_file_checkbox = tk.Checkbutton(root, text="Save to file", variable=save_to_file_var)
+    save_to_file_checkbox.grid(row=5, column=0, sticky="w")
 
-context_var = tk.BooleanVar()
-tk.Checkbutton(root, text="Display context", variable=context_var).grid(row=4, column=0, sticky="w")
+    output_file_entry = tk.Entry(root, width=50)
+    output_file_entry.grid(row=5, column=1)
 
-save_to_file_var = tk.BooleanVar()
-save_to_file_checkbox = tk.Checkbutton(root, text="Save to file", variable=save_to_file_var)
-save_to_file_checkbox.grid(row=5, column=0, sticky="w")
+    run_button = tk.Button(root, text="Search", command=run_script)
+    run_button.grid(row=6, column=0)
+    cancel_button = tk.Button(root, text="Cancel", command=cancel_search, state=tk.DISABLED)
+    cancel_button.grid(row=6, column=1, sticky="w")
 
-output_file_entry = tk.Entry(root, width=50)
-output_file_entry.grid(row=5, column=1)
+    status_var = tk.StringVar(value="Ready")
+    tk.Label(root, textvariable=status_var, anchor="w").grid(row=7, column=0, columnspan=3, sticky="we")
 
-tk.Button(root, text="Run Script", command=run_script).grid(row=6, column=0, columnspan=3)
+    results_text = scrolledtext.ScrolledText(root, width=90, height=20)
+    results_text.grid(row=8, column=0, columnspan=3, sticky="nsew")
+    root.grid_rowconfigure(8, weight=1)
+    root.grid_columnconfigure(1, weight=1)
 
-# Start the Tkinter event loop
-root.mainloop()
+    # Start the Tkinter event loop
+    root.mainloop()
@@ -2,45 +2,216 @@
 
 import os
 import argparse
+import ipaddress
+import itertools
 import re
-from concurrent.futures import ThreadPoolExecutor
-from email_validator import validate_email, EmailNotValidError
+import sqlite3
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
+import dns.resolver
+from email_validator import validate_email, EmailNotValidError, EmailUndeliverableError
+from email_validator.deliverability import validate_email_deliverability
+from lib import file_reader
 
-def extract_emails(file_path):
-    emails = set()
+CHUNKSIZE = 64
+EMAIL_PATTERN = re.compile(rb'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}\b')
+LOCAL_PART_MAX = 64
+# Every byte an address can contain, the regex never matches across anything else
+TOKEN_RUN = re.compile(rb'[A-Za-z0-9._%+-]*')
+TOKEN_TAIL = re.compile(rb'[A-Za-z0-9._%+-]*\Z')
+ADDRESS_TAIL = re.compile(rb'[A-Za-z0-9._%+@-]*\Z')
+MX_CACHE_FILE = 'mx_cache.db'
+MX_CACHE_TTL = 24 * 3600
+NEGATIVE_CACHE_TTL = 3600
+DNS_CONCURRENCY = 8
+DNS_TIMEOUT = 15
+
+# Start of the run of address bytes that ends at `at`, searched LOCAL_PART_MAX bytes at a time
+def token_start(buffer, at, tail=TOKEN_TAIL):
+    start = at
+    while start > 0:
+        lower = max(start - LOCAL_PART_MAX, 0)
+        run = tail.search(buffer, lower, start).start()
+        if run > lower:
+            return run
+        start = lower
+    return start
+
+def token_end(buffer, at):
+    return TOKEN_RUN.match(buffer, at + 1).end()
+
+# The regex only runs on the tokens around '@' bytes, a buffer without one costs a single find
+def find_emails(buffer):
+    matches = []
+    at = buffer.find(b'@')
+    start = token_start(buffer, at) if at != -1 else 0
+    while at != -1:
+        end = token_end(buffer, at)
+        next_at = buffer.find(b'@', at + 1)
+        next_start = token_start(buffer, next_at) if next_at != -1 else 0
+        # Windows are whole tokens, so the regex sees the same boundaries as on the full buffer
+        while next_at != -1 and next_start < end:
+            end = token_end(buffer, next_at)
+            next_at = buffer.find(b'@', next_at + 1)
+            next_start = token_start(buffer, next_at) if next_at != -1 else 0
+        matches.extend(EMAIL_PATTERN.findall(buffer, start, end))
+        at, start = next_at, next_start
+    return matches
+
+def extract_emails(file_path, max_size=file_reader.MAX_SIZE):
+    found = set()
     try:
-        with open(file_path, 'r', encoding='utf-8') as file:
-            for line in file:
-                email_matches = re.findall(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}\b', line)
-                for email in email_matches:
-                    emails.add(email.lower())
-    except UnicodeDecodeError:
-        print(f"Unable to decode file: {file_path}")
-    return emails
+        # Binaries and files above max_size yield nothing
+        tail = b''
+        for block in file_reader.iter_blocks(file_path, max_size):
+            buffer = tail + block
+            # A match never crosses a byte that is neither in TOKEN_RUN nor '@', so the text after the last one is carried over
+            cut = token_start(buffer, len(buffer), ADDRESS_TAIL) or len(buffer)
+            found.update(find_emails(buffer[:cut]))
+            tail = buffer[cut:]
+        found.update(find_emails(tail))
+    except OSError as e:
+        print(f"Unable to read file: {file_path} ({e})")
 
-def extract_emails_from_directory(directory):
-    all_emails = set()
+    if not found:
+        return set()
+    # The pattern is ASCII-only, so the addresses are lowercased and decoded in one go
+    return set(b'\n'.join(found).lower().decode('ascii').split('\n'))
+
+def iter_file_paths(directory):
     for root, _, files in os.walk(directory):
         for file in files:
-            file_path = os.path.join(root, file)
-            all_emails.update(extract_emails(file_path))
+            yield os.path.join(root, file)
+
+# Each worker deduplicates a whole chunk of files, so only one set per chunk crosses the process boundary
+def extract_emails_from_files(file_paths):
+    emails = set()
+    for file_path in file_paths:
+        emails.update(extract_emails(file_path))
+    return emails
+
+def extract_emails_from_directory(directory, jobs=None):
+    file_paths = iter_file_paths(directory)
+    if jobs == 1:
+        return extract_emails_from_files(file_paths)
+
+    all_emails = set()
+    jobs = jobs or os.cpu_count()
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        # Only a window of chunks is queued, so the walk never runs far ahead of the workers
+        pending = set()
+        while chunk := list(itertools.islice(file_paths, CHUNKSIZE)):
+            pending.add(executor.submit(extract_emails_from_files, chunk))
+            if len(pending) >= jobs * 4:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    all_emails.update(future.result())
+        for future in pending:
+            all_emails.update(future.result())
     return all_emails
 
-def validate_email_wrapper(email):
+class DomainCache:
+    """SQLite record of each domain's deliverability, so later runs skip domains checked within the TTL."""
+
+    def __init__(self, path, ttl=MX_CACHE_TTL, negative_ttl=NEGATIVE_CACHE_TTL):
+        self.db = sqlite3.connect(path)
+        self.db.execute("CREATE TABLE IF NOT EXISTS domains (domain TEXT PRIMARY KEY, error TEXT, expires REAL NOT NULL)")
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+
+    # (True, error or None) for a fresh entry, (False, None) when the domain has to be resolved
+    def get(self, domain):
+        row = self.db.execute("SELECT error, expires FROM domains WHERE domain = ?", (domain,)).fetchone()
+        if row is None or row[1] < time.time():
+            return False, None
+        return True, row[0]
+
+    def put(self, domain, error):
+        expires = time.time() + (self.negative_ttl if error else self.ttl)
+        self.db.execute("INSERT OR REPLACE INTO domains (domain, error, expires) VALUES (?, ?, ?)", (domain, error, expires))
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+# Accepts 127.0.0.1, 127.0.0.1:5353, ::1 or [::1]:5353, so a local stub resolver can stand in for the system one
+def make_resolver(nameserver=None, timeout=DNS_TIMEOUT):
+    resolver = dns.resolver.Resolver(configure=nameserver is None)
+    if nameserver:
+        host, port = nameserver, 53
+        if nameserver.startswith('['):
+            host, _, port = nameserver[1:].partition(']:')
+        elif nameserver.count(':') == 1:
+            host, _, port = nameserver.partition(':')
+        resolver.nameservers = [str(ipaddress.ip_address(host))]
+        resolver.port = int(port or 53)
+    resolver.lifetime = timeout
+    return resolver
+
+# (error or None, cacheable); timeouts and dead resolvers let the domain through like email_validator does, but are not cached
+def check_domain(ascii_domain, domain, resolver):
     try:
-        validate_email(email, check_deliverability=True)
-        return email
-    except EmailNotValidError as e:
-        return e
-
-def validate_emails(emails):
-    with ThreadPoolExecutor() as executor:
-        results = executor.map(validate_email_wrapper, emails)
+        info = validate_email_deliverability(ascii_domain, domain, dns_resolver=resolver)
+    except EmailUndeliverableError as e:
+        return str(e), True
+    return None, "unknown-deliverability" not in info
+
+def validate_emails(emails, cache_file=MX_CACHE_FILE, nameserver=None, concurrency=DNS_CONCURRENCY, ttl=MX_CACHE_TTL, timeout=DNS_TIMEOUT):
+    # Syntax is checked locally first, only the surviving domains go to DNS
+    syntax = {}
+    domains = {}
+    for email in emails:
+        try:
+            validated = validate_email(email, check_deliverability=False)
+        except EmailNotValidError as e:
+            syntax[email] = e
+            continue
+        syntax[email] = validated
+        if getattr(validated, "domain_address", None) is None:
+            domains[validated.ascii_domain] = validated.domain
+
+    cache = DomainCache(cache_file, ttl)
+    try:
+        errors = {}
+        pending = []
+        for ascii_domain, domain in domains.items():
+            cached, error = cache.get(ascii_domain)
+            if cached:
+                errors[ascii_domain] = error
+            else:
+                pending.append((ascii_domain, domain))
+
+        # Each domain is resolved once, with a bounded number of queries in flight
+        resolver = make_resolver(nameserver, timeout)
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            futures = {executor.submit(check_domain, ascii_domain, domain, resolver): ascii_domain for ascii_domain, domain in pending}
+            for future in as_completed(futures):
+                error, cacheable = future.result()
+                errors[futures[future]] = error
+                if cacheable:
+                    cache.put(futures[future], error)
+    finally:
+        cache.close()
+
+    results = []
+    for email, validated in syntax.items():
+        if isinstance(validated, EmailNotValidError):
+            results.append(validated)
+        elif getattr(validated, "domain_address", None) is None and errors.get(validated.ascii_domain):
+            results.append(EmailUndeliverableError(errors[validated.ascii_domain]))
+        else:
+            results.append(email)
     return results
 
 def main():
     parser = argparse.ArgumentParser(description="Grab emails from all files in a directory")
     parser.add_argument("directory_path", help="Path to the directory containing files")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="Number of worker processes extracting emails (default: CPU count)")
+    parser.add_argument("--mx-cache", default=MX_CACHE_FILE, help=f"SQLite file caching each domain's deliverability across runs (default: {MX_CACHE_FILE})")
+    parser.add_argument("--cache-ttl", type=float, default=MX_CACHE_TTL, help=f"Seconds a deliverable domain stays cached (default: {MX_CACHE_TTL})")
+    parser.add_argument("--dns-concurrency", type=int, default=DNS_CONCURRENCY, help=f"Maximum DNS lookups in flight (default: {DNS_CONCURRENCY})")
+    parser.add_argument("--dns-timeout", type=float, default=DNS_TIMEOUT, help=f"Seconds allowed per domain lookup (default: {DNS_TIMEOUT})")
+    parser.add_argument("--nameserver", help="Resolver to query instead of the system ones, as IP or IP:port (e.g. a local stub resolver)")
     args = parser.parse_args()
 
     directory = args.directory_path
@@ -48,8 +219,8 @@ def main():
         print("Invalid directory path.")
         return
 
-    all_emails = extract_emails_from_directory(directory)
-    results = validate_emails(all_emails)
+    all_emails = extract_emails_from_directory(directory, args.jobs)
+    results = validate_emails(all_emails, args.mx_cache, args.nameserver, args.dns_concurrency, args.cache_ttl, args.dns_timeout)
     
     good_emails_count = 0
     output_file = 'emails.txt'
@@ -3,6 +3,7 @@ import sys
 import time
 from urllib.parse import urlparse
 from termcolor import colored
+from lib import dns_cache
 
 # List of websites to check
 websites = [
@@ -29,6 +30,8 @@ def check_website(website):
         print(f"An error occurred while accessing {domain}: {e}")
 
 def main():
+    # Hosts are re-checked every 10 seconds, only re-resolve them when their DNS TTL expires
+    dns_cache.install()
     while True:
         for website in websites:
             check_website(website)
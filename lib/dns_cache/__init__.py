@@ -0,0 +1,132 @@
+# pip install dnspython (optional, used to honour the record TTLs)
+
+import ipaddress
+import socket
+import threading
+import time
+
+try:
+    import dns.resolver
+    import dns.exception
+except ImportError:
+    dns = None
+
+DEFAULT_TTL = 300
+NEGATIVE_TTL = 60
+MIN_TTL = 5
+
+# Errors that mean the name will not resolve; EAI_AGAIN is temporary and never cached
+NEGATIVE_ERRORS = {socket.EAI_NONAME, getattr(socket, "EAI_NODATA", socket.EAI_NONAME), socket.EAI_FAIL}
+
+class DnsCache:
+    """In-process DNS cache that keeps answers for their record TTL."""
+
+    def __init__(self, default_ttl=DEFAULT_TTL, negative_ttl=NEGATIVE_TTL):
+        self.default_ttl = default_ttl
+        self.negative_ttl = negative_ttl
+        self._entries = {}
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._getaddrinfo = socket.getaddrinfo
+
+    def resolve(self, host):
+        """Return the cached (family, address) pairs for host, raising socket.gaierror for dead names."""
+        while True:
+            with self._lock:
+                entry = self._entries.get(host)
+                if entry and entry[0] > time.monotonic():
+                    return self._unpack(entry[1])
+
+                # Only one thread queries a given host, the others wait for its answer
+                pending = self._pending.get(host)
+                if pending is None:
+                    pending = self._pending[host] = threading.Event()
+                    break
+            pending.wait()
+
+        try:
+            result, ttl = self._lookup(host)
+            with self._lock:
+                self._entries[host] = (time.monotonic() + ttl, result)
+        finally:
+            with self._lock:
+                del self._pending[host]
+            pending.set()
+        return self._unpack(result)
+
+    def getaddrinfo(self, host, port, family=0, type=0, proto=0, flags=0):
+        """Drop-in replacement for socket.getaddrinfo backed by the cache."""
+        if isinstance(host, bytes):
+            host = host.decode("idna")
+        if not host or flags & socket.AI_NUMERICHOST or flags & socket.AI_CANONNAME or is_ip_address(host):
+            return self._getaddrinfo(host, port, family, type, proto, flags)
+
+        addrinfo = []
+        for address_family, address in self.resolve(host):
+            if family in (0, socket.AF_UNSPEC) or family == address_family:
+                addrinfo.extend(self._getaddrinfo(address, port, address_family, type, proto, flags | socket.AI_NUMERICHOST))
+        if not addrinfo:
+            raise socket.gaierror(socket.EAI_NONAME, "Name or service not known")
+        return addrinfo
+
+    def install(self):
+        socket.getaddrinfo = self.getaddrinfo
+
+    def uninstall(self):
+        socket.getaddrinfo = self._getaddrinfo
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _lookup(self, host):
+        # The system resolver still decides the addresses, so hosts files and search domains keep working
+        try:
+            infos = self._getaddrinfo(host, None, 0, socket.SOCK_STREAM)
+        except socket.gaierror as e:
+            if e.errno in NEGATIVE_ERRORS:
+                return e, self.negative_ttl
+            raise
+
+        addresses = []
+        for info in infos:
+            pair = (info[0], info[4][0])
+            if pair not in addresses:
+                addresses.append(pair)
+        return addresses, self._ttl(host)
+
+    def _ttl(self, host):
+        if dns is None:
+            return self.default_ttl
+        try:
+            answer = dns.resolver.resolve(host, "A", raise_on_no_answer=False, lifetime=2.0)
+        except dns.exception.DNSException:
+            return self.default_ttl
+        if answer.rrset is None:
+            return self.default_ttl
+        return max(answer.rrset.ttl, MIN_TTL)
+
+    @staticmethod
+    def _unpack(result):
+        if isinstance(result, socket.gaierror):
+            raise socket.gaierror(*result.args)
+        return result
+
+def is_ip_address(host):
+    try:
+        ipaddress.ip_address(host.split("%", 1)[0])
+        return True
+    except ValueError:
+        return False
+
+# Shared cache for every caller in the process
+default_cache = DnsCache()
+
+def resolve(host):
+    return default_cache.resolve(host)
+
+def install():
+    default_cache.install()
+
+def uninstall():
+    default_cache.uninstall()
@@ -0,0 +1,66 @@
+# Shared file reading for the scanning scripts: binaries and oversized files are skipped, text is decoded lossily
+
+import codecs
+import io
+import os
+
+SNIFF_SIZE = 8192
+CHUNK_SIZE = 1024 * 1024
+MAX_SIZE = 256 * 1024 * 1024
+BINARY_CONTROL_RATIO = 0.3
+
+# UTF-16 text is full of NUL bytes, so a BOM has to be checked before the NUL test
+BOMS = ((codecs.BOM_UTF8, "utf-8-sig"), (codecs.BOM_UTF16_LE, "utf-16"), (codecs.BOM_UTF16_BE, "utf-16"))
+CONTROL_BYTES = bytes(byte for byte in range(32) if byte not in b"\t\n\r\f\b\x1b") + b"\x7f"
+
+def sniff_encoding(block):
+    for bom, encoding in BOMS:
+        if block.startswith(bom):
+            return encoding
+    return None
+
+def is_binary(block):
+    """Cheap check on the first block of a file: NUL bytes or mostly control characters mean binary."""
+    if not block or sniff_encoding(block):
+        return False
+    if b"\0" in block:
+        return True
+    control = len(block) - len(block.translate(None, CONTROL_BYTES))
+    return control / len(block) > BINARY_CONTROL_RATIO
+
+def too_large(file, max_size):
+    return max_size is not None and os.fstat(file.fileno()).st_size > max_size
+
+def iter_blocks(file_path, max_size=MAX_SIZE, chunk_size=CHUNK_SIZE):
+    """Raw chunks of a text file, nothing for binaries and files above max_size."""
+    with open(file_path, "rb") as file:
+        if too_large(file, max_size):
+            return
+        block = file.read(chunk_size)
+        if is_binary(block[:SNIFF_SIZE]):
+            return
+        # Byte-level callers expect ASCII-compatible data, so UTF-16 text is re-encoded as UTF-8
+        decoder = codecs.getincrementaldecoder("utf-16")(errors="replace") if sniff_encoding(block) == "utf-16" else None
+        while block:
+            yield decoder.decode(block).encode("utf-8") if decoder else block
+            block = file.read(chunk_size)
+
+def open_text(file_path, max_size=MAX_SIZE):
+    """Lossily decoded text stream of the file, None for binaries and files above max_size."""
+    file = open(file_path, "rb", buffering=CHUNK_SIZE)
+    try:
+        block = None if too_large(file, max_size) else file.peek(SNIFF_SIZE)[:SNIFF_SIZE]
+        if block is None or is_binary(block):
+            file.close()
+            return None
+        return io.TextIOWrapper(file, encoding=sniff_encoding(block) or "utf-8", errors="replace")
+    except BaseException:
+        file.close()
+        raise
+
+def read_text(file_path, max_size=MAX_SIZE):
+    text = open_text(file_path, max_size)
+    if text is None:
+        return None
+    with text:
+        return text.read()
@@ -1,34 +1,308 @@
 import asyncio
 import argparse
+import collections
+import concurrent.futures
+import errno
 import ipaddress
 import json
+import multiprocessing
+import queue
+import random
+import sqlite3
+import ssl
+import subprocess
 import sys
 from datetime import datetime
 
-async def scan_port(ip, port, banner, username=None, password=None, timeout=1):
-    try:
-        reader, writer = await asyncio.wait_for(asyncio.open_connection(ip, port), timeout=timeout)
-        result = {"ip": ip, "port": port, "status": "Open"}
+MAX_IN_FLIGHT = 500
+MIN_IN_FLIGHT = 16
+BACKOFF_COOLDOWN = 0.5
+OUTCOME_WINDOW = 200
+TIMEOUT_SPIKE_FACTOR = 2.0
+TIMEOUT_SPIKE_MARGIN = 0.1
+RECOVERY_INTERVAL = 200
+MAX_HOSTS = 1 << 24
+STATE_COMMIT_EVERY = 500
+SHARD_BATCH = 256
+BANNER_DEADLINE = 1.0
+BANNER_BYTES = 1024
+DISCOVERY_PORTS = (80, 443, 22, 445, 3389, 8080)
+MAX_RESOURCE_RETRIES = 5
+
+# Out of sockets or file descriptors: the port was never probed, so it must not be reported Closed
+# EADDRNOTAVAIL is left out, an unusable target address never goes away with a retry
+RESOURCE_ERRNOS = {errno.EMFILE, errno.ENFILE, errno.ENOBUFS, errno.EAGAIN}
+
+async def probe_port(ip, port, banner, username=None, password=None, timeout=1):
+    reader, writer = await asyncio.wait_for(asyncio.open_connection(ip, port), timeout=timeout)
+    result = {"ip": ip, "port": port, "status": "Open"}
 
+    try:
         if banner:
-            result["banner"] = await grab_banner(reader)
+            result["banner"] = await grab_banner(reader, writer, ip, port)
 
         if username and password:
             result["authentication"] = await authenticate(reader, writer, username, password)
-
+    finally:
         writer.close()
+
+    return result
+
+async def scan_port(ip, port, banner, username=None, password=None, timeout=1):
+    try:
+        result = await probe_port(ip, port, banner, username, password, timeout)
     except (asyncio.TimeoutError, OSError):
         result = {"ip": ip, "port": port, "status": "Closed"}
 
     return result
 
-async def grab_banner(reader):
+class ScanScheduler:
+    """Caps connections in flight and per second, backing off when sockets run out or timeouts spike."""
+
+    def __init__(self, max_in_flight=MAX_IN_FLIGHT, rate=None):
+        self.max_in_flight = max(max_in_flight, 1)
+        self.limit = self.max_in_flight
+        self.rate = rate
+        self.rate_factor = 1.0
+        self.in_flight = 0
+        self.condition = asyncio.Condition()
+        self.next_slot = 0.0
+        self.cooldown_until = 0.0
+        self.outcomes = collections.deque(maxlen=OUTCOME_WINDOW)
+        self.baseline = None
+        self.since_adjust = 0
+
+    async def acquire(self):
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.in_flight < self.limit)
+            self.in_flight += 1
+
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        start = max(now, self.cooldown_until)
+        if self.rate:
+            start = max(start, self.next_slot)
+            self.next_slot = start + 1 / (self.rate * self.rate_factor)
+        if start > now:
+            await asyncio.sleep(start - now)
+
+    async def release(self, outcome):
+        async with self.condition:
+            self.in_flight -= 1
+            self._adjust(outcome)
+            self.condition.notify_all()
+
+    def _backoff(self):
+        self.limit = max(min(MIN_IN_FLIGHT, self.max_in_flight), self.limit // 2)
+        self.rate_factor = max(self.rate_factor / 2, 0.05)
+        self.cooldown_until = asyncio.get_running_loop().time() + BACKOFF_COOLDOWN
+        self.since_adjust = 0
+
+    def _adjust(self, outcome):
+        self.since_adjust += 1
+        if outcome == "exhausted":
+            self._backoff()
+            return
+
+        self.outcomes.append(outcome == "timeout")
+        if len(self.outcomes) < OUTCOME_WINDOW:
+            return
+
+        # Timeouts are normal on sparse ranges, only a jump above the long-run ratio means congestion
+        ratio = sum(self.outcomes) / len(self.outcomes)
+        self.baseline = ratio if self.baseline is None else self.baseline * 0.99 + ratio * 0.01
+        if self.since_adjust >= OUTCOME_WINDOW and ratio > self.baseline * TIMEOUT_SPIKE_FACTOR + TIMEOUT_SPIKE_MARGIN:
+            self._backoff()
+        elif self.since_adjust >= RECOVERY_INTERVAL:
+            self.limit = min(self.max_in_flight, self.limit + max(1, self.max_in_flight // 20))
+            self.rate_factor = min(1.0, self.rate_factor * 1.25)
+            self.since_adjust = 0
+
+    # Backs off and retries while resources are exhausted, up to MAX_RESOURCE_RETRIES times per probe
+    async def scan(self, ip, port, banner, username=None, password=None, timeout=1):
+        for _ in range(MAX_RESOURCE_RETRIES + 1):
+            await self.acquire()
+            outcome = "closed"
+            try:
+                result = await probe_port(ip, port, banner, username, password, timeout)
+                outcome = "open"
+                return result
+            except asyncio.TimeoutError:
+                outcome = "timeout"
+                return {"ip": ip, "port": port, "status": "Closed"}
+            except OSError as e:
+                if e.errno not in RESOURCE_ERRNOS:
+                    return {"ip": ip, "port": port, "status": "Closed"}
+                outcome = "exhausted"
+                error = e.strerror
+            finally:
+                await self.release(outcome)
+        return {"ip": ip, "port": port, "status": "Closed", "error": error}
+
+    # A refused connection still proves the host is there, only silence or unreachable counts as no answer
+    async def knock(self, ip, port, timeout=1):
+        for _ in range(MAX_RESOURCE_RETRIES + 1):
+            await self.acquire()
+            outcome = "closed"
+            try:
+                _, writer = await asyncio.wait_for(asyncio.open_connection(ip, port), timeout=timeout)
+                writer.close()
+                outcome = "open"
+                return True
+            except asyncio.TimeoutError:
+                outcome = "timeout"
+                return False
+            except ConnectionRefusedError:
+                return True
+            except OSError as e:
+                if e.errno not in RESOURCE_ERRNOS:
+                    return False
+                outcome = "exhausted"
+            finally:
+                await self.release(outcome)
+        return False
+
+def normalize_address(ip):
     try:
-        data = await reader.read(1024)
-        return data.decode().strip()
-    except asyncio.CancelledError:
+        return str(ipaddress.ip_address(ip.split("%", 1)[0]))
+    except ValueError:
+        return ip
+
+# Hosts the kernel has recently exchanged frames with on the local segments (ARP for IPv4, NDP for IPv6)
+def read_neighbors():
+    neighbors = set()
+    try:
+        with open("/proc/net/arp", "r") as arp_file:
+            next(arp_file, None)
+            for line in arp_file:
+                fields = line.split()
+                # Flags 0x0 is an incomplete entry, the address never answered
+                if len(fields) >= 3 and fields[2] != "0x0":
+                    neighbors.add(normalize_address(fields[0]))
+    except OSError:
         pass
 
+    try:
+        output = subprocess.run(["ip", "neigh", "show"], capture_output=True, text=True, timeout=5).stdout
+    except (OSError, subprocess.SubprocessError):
+        output = ""
+    for line in output.splitlines():
+        fields = line.split()
+        if fields and fields[-1] not in ("FAILED", "INCOMPLETE"):
+            neighbors.add(normalize_address(fields[0]))
+    return neighbors
+
+class HostDiscovery:
+    """Pre-pass that only lets hosts in the neighbor table or answering on a few common ports through to the full scan."""
+
+    def __init__(self, ports=DISCOVERY_PORTS, timeout=1, method="both", unresponsive="skip"):
+        self.ports = ports
+        self.timeout = timeout
+        self.use_tcp = method in ("tcp", "both")
+        self.neighbors = read_neighbors() if method in ("neighbors", "both") else set()
+        self.unresponsive = unresponsive
+        self.up = 0
+        self.down = 0
+        self.knocks = set()
+
+    async def responsive(self, ip, scheduler):
+        if normalize_address(ip) in self.neighbors or (self.use_tcp and await self._knock(ip, scheduler)):
+            self.up += 1
+            return True
+
+        self.down += 1
+        if self.unresponsive == "report":
+            print(f"No response from {ip}, skipping it.", file=sys.stderr)
+        return self.unresponsive == "scan"
+
+    async def _knock(self, ip, scheduler):
+        tasks = [asyncio.ensure_future(scheduler.knock(ip, port, self.timeout)) for port in self.ports]
+        # The first answer settles it, the remaining knocks finish in the background and free their slots
+        for task in tasks:
+            self.knocks.add(task)
+            task.add_done_callback(self.knocks.discard)
+        for next_done in asyncio.as_completed(tasks):
+            if await next_done:
+                return True
+        return False
+
+# Protocol name -> (probe coroutine, read deadline in seconds, byte budget), and port -> protocol name
+PROBES = {}
+PROBE_PORTS = {}
+
+def register_probe(name, ports=(), deadline=BANNER_DEADLINE, max_bytes=BANNER_BYTES):
+    def decorator(probe):
+        PROBES[name] = (probe, deadline, max_bytes)
+        for port in ports:
+            PROBE_PORTS[port] = name
+        return probe
+    return decorator
+
+async def read_budget(reader, max_bytes, until=None):
+    data = b""
+    while len(data) < max_bytes:
+        chunk = await reader.read(max_bytes - len(data))
+        if not chunk:
+            break
+        data += chunk
+        if until is None or until in data:
+            break
+    return data
+
+def sni_name(ip):
+    try:
+        ipaddress.ip_address(ip)
+        return None
+    except ValueError:
+        return ip
+
+# Services that talk first (SSH, SMTP, FTP, POP3, IMAP, MySQL...) and anything unknown
+@register_probe("passive")
+async def passive_probe(reader, writer, ip, port, max_bytes):
+    return await read_budget(reader, max_bytes)
+
+@register_probe("http", ports=(80, 81, 591, 3000, 5000, 8000, 8008, 8080, 8081, 8888, 9000))
+async def http_probe(reader, writer, ip, port, max_bytes):
+    host = f"[{ip}]" if ":" in ip else ip
+    writer.write(f"HEAD / HTTP/1.0\r\nHost: {host}\r\nUser-Agent: port_scanner\r\n\r\n".encode())
+    await writer.drain()
+    return await read_budget(reader, max_bytes, until=b"\r\n\r\n")
+
+@register_probe("tls", ports=(443, 465, 636, 853, 990, 993, 995, 5061, 6443, 8443, 9443))
+async def tls_probe(reader, writer, ip, port, max_bytes):
+    # StreamWriter.start_tls arrived in Python 3.11
+    if not hasattr(writer, "start_tls"):
+        return b""
+    context = ssl.create_default_context()
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    # The handshake sends a ClientHello with SNI when scanning by name
+    await writer.start_tls(context, server_hostname=sni_name(ip))
+    ssl_object = writer.get_extra_info("ssl_object")
+    cipher = ssl_object.cipher()
+    alpn = ssl_object.selected_alpn_protocol()
+    return " ".join(part for part in (ssl_object.version(), cipher[0] if cipher else None, alpn) if part).encode()
+
+@register_probe("redis", ports=(6379, 6380))
+async def redis_probe(reader, writer, ip, port, max_bytes):
+    writer.write(b"PING\r\n")
+    await writer.drain()
+    return await read_budget(reader, max_bytes, until=b"\r\n")
+
+@register_probe("memcached", ports=(11211,))
+async def memcached_probe(reader, writer, ip, port, max_bytes):
+    writer.write(b"version\r\n")
+    await writer.drain()
+    return await read_budget(reader, max_bytes, until=b"\r\n")
+
+async def grab_banner(reader, writer, ip, port):
+    probe, deadline, max_bytes = PROBES[PROBE_PORTS.get(port, "passive")]
+    try:
+        data = await asyncio.wait_for(probe(reader, writer, ip, port, max_bytes), timeout=deadline)
+    except (asyncio.TimeoutError, OSError):
+        return None
+    return data.decode(errors="replace").strip()
+
 async def authenticate(reader, writer, username, password):
     try:
         writer.write(f"{username}:{password}\n".encode())
@@ -39,40 +313,279 @@ async def authenticate(reader, writer, username, password):
     except asyncio.CancelledError:
         pass
 
-async def scan_ports(ip, ports, banner, username=None, password=None, timeout=1):
-    tasks = [scan_port(ip, port, banner, username, password, timeout) for port in ports]
-    return await asyncio.gather(*tasks)
-
-async def scan_cidr(cidr, ports, banner, username=None, password=None, timeout=1):
-    network = ipaddress.IPv4Network(cidr, strict=False)
-    tasks = [scan_ports(str(ip), ports, banner, username, password, timeout) for ip in network.hosts()]
-    return await asyncio.gather(*tasks)
-
-async def scan_file(file, ports, banner, username=None, password=None, timeout=1):
+def address_class(version):
+    return ipaddress.IPv4Address if version == 4 else ipaddress.IPv6Address
+
+def sample_offsets(count, sample):
+    seen = set()
+    while len(seen) < sample:
+        offset = random.randrange(count)
+        if offset not in seen:
+            seen.add(offset)
+            yield offset
+
+# Validates eagerly and returns a generator, so an oversized range fails before the scan starts
+def iter_addresses(first, last, version, sample=None, max_hosts=MAX_HOSTS):
+    count = last - first + 1
+    make_address = address_class(version)
+    if sample and sample < count:
+        return (str(make_address(first + offset)) for offset in sample_offsets(count, sample))
+    if count > max_hosts:
+        raise ValueError(f"{count} addresses is more than --max-hosts {max_hosts}, use --sample or --hitlist")
+    return (str(make_address(value)) for value in range(first, last + 1))
+
+def host_bounds(network):
+    first = int(network.network_address)
+    last = int(network.broadcast_address)
+    # Same hosts as ipaddress' hosts(): IPv4 drops network and broadcast, IPv6 drops the subnet-router anycast
+    if network.num_addresses > 2:
+        first += 1
+        if network.version == 4:
+            last -= 1
+    return first, last
+
+def iter_hitlist_targets(hitlist, networks):
+    with open(hitlist, "r") as hitlist_file:
+        for line in hitlist_file:
+            try:
+                address = ipaddress.ip_address(line.strip())
+            except ValueError:
+                continue
+            if any(address.version == network.version and address in network for network in networks):
+                yield str(address)
+
+def iter_cidr_targets(cidr, sample=None, max_hosts=MAX_HOSTS, hitlist=None):
+    network = ipaddress.ip_network(cidr, strict=False)
+    if hitlist:
+        return iter_hitlist_targets(hitlist, [network])
+    first, last = host_bounds(network)
+    return iter_addresses(first, last, network.version, sample, max_hosts)
+
+def iter_range_targets(start_ip, end_ip, sample=None, max_hosts=MAX_HOSTS, hitlist=None):
+    start_ip_obj = ipaddress.ip_address(start_ip.strip())
+    end_ip_obj = ipaddress.ip_address(end_ip.strip())
+    if start_ip_obj.version != end_ip_obj.version:
+        raise ValueError(f"Range {start_ip}-{end_ip} mixes IPv4 and IPv6")
+    if hitlist:
+        return iter_hitlist_targets(hitlist, list(ipaddress.summarize_address_range(start_ip_obj, end_ip_obj)))
+    return iter_addresses(int(start_ip_obj), int(end_ip_obj), start_ip_obj.version, sample, max_hosts)
+
+# Host names may contain dashes too, so only two addresses make a range
+def is_address_range(target):
+    start_ip, separator, end_ip = target.partition("-")
+    try:
+        ipaddress.ip_address(start_ip.strip())
+        ipaddress.ip_address(end_ip.strip())
+        return bool(separator)
+    except ValueError:
+        return False
+
+# Lines can be addresses of either family, CIDRs, start-end ranges or host names
+def iter_file_targets(file, sample=None, max_hosts=MAX_HOSTS, hitlist=None):
     with open(file, "r") as ip_file:
-        tasks = [scan_ports(ip.strip(), ports, banner, username, password, timeout) for ip in ip_file]
-        return await asyncio.gather(*tasks)    
-
-async def scan_range(start_ip, end_ip, ports, banner, username=None, password=None, timeout=1):
-    start_ip_obj = ipaddress.IPv4Address(start_ip)
-    end_ip_obj = ipaddress.IPv4Address(end_ip)
-
-    current_ip_obj = start_ip_obj
-    tasks = []
-
-    while current_ip_obj <= end_ip_obj:
-        tasks.append(scan_ports(str(current_ip_obj), ports, banner, username, password, timeout))
-        current_ip_obj += 1
-
-    return await asyncio.gather(*tasks)
+        for line in ip_file:
+            target = line.strip()
+            if not target:
+                continue
+            try:
+                if "/" in target:
+                    yield from iter_cidr_targets(target, sample, max_hosts, hitlist)
+                elif is_address_range(target):
+                    yield from iter_range_targets(*target.split("-", 1), sample, max_hosts, hitlist)
+                else:
+                    yield target
+            except ValueError as e:
+                print(f"Skipping '{target}': {e}", file=sys.stderr)
+
+# Workers pull (ip, port) pairs from a lazy iterator, so only the in-flight probes exist at any time
+async def stream_targets(ips, ports, on_result, banner, username=None, password=None, timeout=1, scheduler=None, skip=None, discovery=None):
+    scheduler = scheduler or ScanScheduler()
+    if discovery is not None:
+        await stream_discovered_targets(ips, ports, on_result, banner, username, password, timeout, scheduler, skip, discovery)
+        return
+
+    targets = ((ip, port) for ip in ips for port in ports if skip is None or not skip(ip, port))
+
+    async def worker():
+        for ip, port in targets:
+            on_result(await scheduler.scan(ip, port, banner, username, password, timeout))
+
+    await asyncio.gather(*(worker() for _ in range(scheduler.max_in_flight)))
+
+# Responsive hosts feed a bounded queue, so the full scan starts while discovery is still going through the addresses
+async def stream_discovered_targets(ips, ports, on_result, banner, username, password, timeout, scheduler, skip, discovery):
+    targets = asyncio.Queue(maxsize=scheduler.max_in_flight)
+    ips = iter(ips)
+
+    async def discoverer():
+        for ip in ips:
+            if await discovery.responsive(ip, scheduler):
+                for port in ports:
+                    if skip is None or not skip(ip, port):
+                        await targets.put((ip, port))
+
+    async def discover_all():
+        await asyncio.gather(*(discoverer() for _ in range(max(1, scheduler.max_in_flight // len(discovery.ports)))))
+        for _ in range(scheduler.max_in_flight):
+            await targets.put(None)
+
+    async def worker():
+        while (target := await targets.get()) is not None:
+            on_result(await scheduler.scan(*target, banner, username, password, timeout))
+
+    await asyncio.gather(discover_all(), *(worker() for _ in range(scheduler.max_in_flight)))
+
+class ResultCollector:
+    """Groups streamed results back into the per-IP lists save_to_json and print_results expect."""
+
+    def __init__(self, ports, open_only=False):
+        self.port_order = {port: index for index, port in enumerate(ports)}
+        self.open_only = open_only
+        self.results = {}
+
+    # With open_only, hosts only get an entry once something answers
+    def register(self, ips):
+        for ip in ips:
+            if not self.open_only:
+                self.results.setdefault(ip, [])
+            yield ip
+
+    def collect(self, result):
+        if not self.open_only or result["status"] == "Open":
+            self.results.setdefault(result["ip"], []).append(result)
+
+    def collected(self):
+        return [sorted(ip_results, key=lambda result: self.port_order.get(result["port"], 0)) for ip_results in self.results.values() if ip_results]
+
+async def scan_targets(ips, ports, banner, username=None, password=None, timeout=1, scheduler=None, open_only=False, discovery=None):
+    collector = ResultCollector(ports, open_only)
+    await stream_targets(collector.register(ips), ports, collector.collect, banner, username, password, timeout, scheduler, discovery=discovery)
+    return collector.collected()
+
+async def scan_ports(ip, ports, banner, username=None, password=None, timeout=1, scheduler=None, open_only=False, discovery=None):
+    results = await scan_targets([ip], ports, banner, username, password, timeout, scheduler, open_only, discovery)
+    return results[0] if results else []
+
+async def scan_cidr(cidr, ports, banner, username=None, password=None, timeout=1, scheduler=None, open_only=False, discovery=None):
+    return await scan_targets(iter_cidr_targets(cidr), ports, banner, username, password, timeout, scheduler, open_only, discovery)
+
+async def scan_file(file, ports, banner, username=None, password=None, timeout=1, scheduler=None, open_only=False, discovery=None):
+    return await scan_targets(iter_file_targets(file), ports, banner, username, password, timeout, scheduler, open_only, discovery)
+
+async def scan_range(start_ip, end_ip, ports, banner, username=None, password=None, timeout=1, scheduler=None, open_only=False, discovery=None):
+    return await scan_targets(iter_range_targets(start_ip, end_ip), ports, banner, username, password, timeout, scheduler, open_only, discovery)
+
+class ScanState:
+    """SQLite record of every probed (ip, port), so interrupted scans can resume and runs can be compared."""
+
+    def __init__(self, path, spec, resume=False):
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS runs (id INTEGER PRIMARY KEY, spec TEXT NOT NULL, started TEXT NOT NULL, finished TEXT, seed INTEGER)")
+        # State files written before --sample was seeded have no seed column
+        if "seed" not in [column[1] for column in self.db.execute("PRAGMA table_info(runs)")]:
+            self.db.execute("ALTER TABLE runs ADD COLUMN seed INTEGER")
+        self.db.execute("CREATE TABLE IF NOT EXISTS probes (run_id INTEGER NOT NULL, ip TEXT NOT NULL, port INTEGER NOT NULL, "
+                        "status TEXT NOT NULL, result TEXT NOT NULL, PRIMARY KEY (run_id, ip, port)) WITHOUT ROWID")
+        self.spec = spec
+        self.pending = 0
+
+        # Every run of a spec samples with the same seed, so resumed and compared runs cover the same hosts
+        row = self.db.execute("SELECT seed FROM runs WHERE spec = ? AND seed IS NOT NULL ORDER BY id LIMIT 1", (spec,)).fetchone()
+        self.seed = row[0] if row else random.randrange(1 << 32)
+
+        row = None
+        if resume:
+            row = self.db.execute("SELECT id FROM runs WHERE spec = ? AND finished IS NULL ORDER BY id DESC LIMIT 1", (spec,)).fetchone()
+        if row:
+            self.run_id = row[0]
+        else:
+            self.run_id = self.db.execute("INSERT INTO runs (spec, started, seed) VALUES (?, ?, ?)",
+                                          (spec, datetime.now().isoformat(), self.seed)).lastrowid
+        self.resumed = row is not None
+
+        row = self.db.execute("SELECT id FROM runs WHERE spec = ? AND finished IS NOT NULL AND id < ? ORDER BY id DESC LIMIT 1",
+                              (spec, self.run_id)).fetchone()
+        self.previous_run_id = row[0] if row else None
+        self.db.commit()
+
+    def probed(self, ip, port):
+        return is_probed(self.db, self.run_id, ip, port)
+
+    def replay(self, on_result):
+        replayed = 0
+        for (result,) in self.db.execute("SELECT result FROM probes WHERE run_id = ?", (self.run_id,)):
+            on_result(json.loads(result))
+            replayed += 1
+        return replayed
+
+    def record(self, result):
+        self.db.execute("INSERT OR REPLACE INTO probes (run_id, ip, port, status, result) VALUES (?, ?, ?, ?, ?)",
+                        (self.run_id, result["ip"], result["port"], result["status"], json.dumps(result)))
+        self.pending += 1
+        if self.pending >= STATE_COMMIT_EVERY:
+            self.db.commit()
+            self.pending = 0
+
+    def finish(self):
+        self.db.execute("UPDATE runs SET finished = ? WHERE id = ?", (datetime.now().isoformat(), self.run_id))
+        self.db.commit()
+
+    # Ports that opened or closed since the previous finished run with the same targets
+    def changes(self):
+        if self.previous_run_id is None:
+            return []
+        rows = self.db.execute(
+            "SELECT current.result, previous.status FROM probes AS current "
+            "JOIN probes AS previous ON previous.run_id = ? AND previous.ip = current.ip AND previous.port = current.port "
+            "WHERE current.run_id = ? AND (current.status = 'Open') != (previous.status = 'Open') "
+            "ORDER BY current.ip, current.port", (self.previous_run_id, self.run_id))
+        changes = []
+        for result, previous_status in rows:
+            change = json.loads(result)
+            change["previous"] = previous_status
+            changes.append(change)
+        return changes
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+def is_probed(db, run_id, ip, port):
+    return db.execute("SELECT 1 FROM probes WHERE run_id = ? AND ip = ? AND port = ?", (run_id, ip, port)).fetchone() is not None
+
+def scan_spec(args, ports):
+    return json.dumps({"cidr": args.cidr, "range": args.range, "file": args.file, "ip": args.ip,
+                       "sample": args.sample, "hitlist": args.hitlist, "ports": ports}, sort_keys=True)
+
+def output_path(output_file, extension):
+    current_time = datetime.now().strftime("%d-%m-%Y-%H%M")
+    return f"{output_file}_{current_time}.{extension}"
 
 def save_to_json(data, output_file):
-    current_time = datetime.now().strftime("%d-%m-%Y-%H%M")
-    file_name = f"{output_file}_{current_time}.json"
+    file_name = output_path(output_file, "json")
 
     with open(file_name, 'w') as json_file:
         json.dump(data, json_file, indent=2)
 
+def save_to_jsonl(data, output_file=None):
+    if output_file is None:
+        for result in data:
+            print(json.dumps(result))
+        return
+
+    with open(output_path(output_file, "jsonl"), 'w') as jsonl_file:
+        for result in data:
+            jsonl_file.write(json.dumps(result) + "\n")
+
+# One JSON object per line, written as each probe completes
+def jsonl_writer(stream, open_only=False):
+    def on_result(result):
+        if not open_only or result["status"] == "Open":
+            stream.write(json.dumps(result) + "\n")
+            stream.flush()
+    return on_result
+
 def print_results(results):
     for ip_results in results:
         if isinstance(ip_results, list):
@@ -88,6 +601,9 @@ def print_results(results):
                 if "authentication" in result:
                     port_status += f" - Authentication: {'Successful' if result['authentication'] else 'Failed'}"
 
+                if "error" in result:
+                    port_status += f" - Error: {result['error']}"
+
                 print(port_status)
 
             print()
@@ -101,19 +617,130 @@ def print_results(results):
             if "authentication" in ip_results:
                 port_status += f" - Authentication: {'Successful' if ip_results['authentication'] else 'Failed'}"
 
+            if "error" in ip_results:
+                port_status += f" - Error: {ip_results['error']}"
+
             print(f"IP: {ip_address} - {port_status}\n")
 
+def print_changes(changes):
+    if not changes:
+        print("No ports changed since the previous run.")
+    for change in changes:
+        print(f"IP: {change['ip']} - Port: {change['port']} - {change['status']} (was {change['previous']})")
+
+def build_targets(args):
+    if args.cidr:
+        targets = iter_cidr_targets(args.cidr, args.sample, args.max_hosts, args.hitlist)
+        output_file_name = args.cidr.replace("/", "_").replace(":", "-")
+    elif args.range:
+        start_ip, end_ip = args.range.split('-')
+        targets = iter_range_targets(start_ip, end_ip, args.sample, args.max_hosts, args.hitlist)
+        output_file_name = args.range.replace("/", "_").replace(":", "-")
+    elif args.file:
+        targets = iter_file_targets(args.file, args.sample, args.max_hosts, args.hitlist)
+        output_file_name = args.file
+    else:
+        targets = [args.ip]
+        output_file_name = args.ip.replace(":", "-")
+    return targets, args.output or output_file_name
+
+def build_discovery(args):
+    if not args.discover:
+        return None
+    discovery_ports = tuple(int(port) for port in args.discover_ports.split(',')) if args.discover_ports else DISCOVERY_PORTS
+    return HostDiscovery(discovery_ports, args.timeout, args.discover, args.unresponsive)
+
+scan_results = None
+
+def init_scan_worker(results_queue):
+    global scan_results
+    scan_results = results_queue
+
+# Every shard walks the same target sequence (same sampling seed) and keeps every shards-th host
+def run_scan_shard(args, ports, shard, shards, seed, run_id=None):
+    random.seed(seed)
+    targets, _ = build_targets(args)
+    targets = (ip for index, ip in enumerate(targets) if index % shards == shard)
+    scheduler = ScanScheduler(max(1, args.max_in_flight // shards), args.rate / shards if args.rate else None)
+    discovery = build_discovery(args)
+
+    db = sqlite3.connect(args.state, timeout=30) if run_id is not None else None
+    skip = (lambda ip, port: is_probed(db, run_id, ip, port)) if db is not None else None
+    # Without a state file nothing downstream needs closed ports under --open-only, so they never cross the pipe
+    drop_closed = args.open_only and not args.state
+    batch = []
+
+    def on_result(result):
+        if drop_closed and result["status"] != "Open":
+            return
+        batch.append(result)
+        if len(batch) >= SHARD_BATCH:
+            scan_results.put(batch.copy())
+            batch.clear()
+
+    try:
+        asyncio.run(stream_targets(targets, ports, on_result, args.banner, args.username, args.password, args.timeout, scheduler, skip, discovery))
+    finally:
+        if db is not None:
+            db.close()
+    if batch:
+        scan_results.put(batch)
+    scan_results.put((shard, discovery.up if discovery else 0, discovery.down if discovery else 0))
+
+# Shards stream result batches back, so the parent keeps the state, jsonl and collector handling of a single-process scan
+def sharded_scan(args, ports, on_result, run_id=None, seed=None):
+    shards = args.procs
+    seed = random.randrange(1 << 32) if seed is None else seed
+    results_queue = multiprocessing.Queue()
+    finished = up = down = 0
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=shards, initializer=init_scan_worker, initargs=(results_queue,)) as executor:
+        futures = [executor.submit(run_scan_shard, args, ports, shard, shards, seed, run_id) for shard in range(shards)]
+        while finished < shards:
+            try:
+                message = results_queue.get(timeout=1)
+            except queue.Empty:
+                for future in futures:
+                    if future.done() and future.exception() is not None:
+                        raise future.exception()
+                continue
+
+            if isinstance(message, tuple):
+                finished += 1
+                up += message[1]
+                down += message[2]
+                continue
+            for result in message:
+                on_result(result)
+    return up, down
+
 def parse_args():
     parser = argparse.ArgumentParser(description="Advanced asynchronous port scanner")
-    parser.add_argument("-c", "--cidr", help="CIDR notation for scanning multiple IPs")
+    parser.add_argument("-c", "--cidr", help="CIDR notation for scanning multiple IPs (IPv4 or IPv6)")
     parser.add_argument("-i", "--ip", help="Single IP to scan")
-    parser.add_argument("-r", "--range", help="IP range for scanning")
-    parser.add_argument("-f", "--file", help="IPs from a file")
+    parser.add_argument("-r", "--range", help="IP range for scanning (IPv4 or IPv6)")
+    parser.add_argument("-f", "--file", help="IPs from a file, one address, CIDR or range per line")
+    parser.add_argument("--sample", type=int, help="Scan this many random addresses of each CIDR or range instead of all of them")
+    parser.add_argument("--hitlist", help="Only scan the addresses from this file that fall inside the CIDR or range, or the CIDR and range lines of -f")
+    parser.add_argument("--max-hosts", type=int, default=MAX_HOSTS, help=f"Refuse to expand CIDRs or ranges larger than this (default: {MAX_HOSTS})")
     parser.add_argument("-l", "--portlist", help="File containing a list of ports")
     parser.add_argument("-p", "--ports", help="Comma-separated list of ports to scan")
     parser.add_argument("-t", "--timeout", type=float, default=1, help="Timeout value in seconds (default: 1)")
+    parser.add_argument("--max-in-flight", type=int, default=MAX_IN_FLIGHT, help=f"Maximum connections in flight (default: {MAX_IN_FLIGHT})")
+    parser.add_argument("--procs", type=int, default=1, help="Split the targets across this many processes, sharing --max-in-flight and --rate (default: 1)")
+    parser.add_argument("--rate", type=float, help="Target connections per second (default: unlimited)")
+    parser.add_argument("--discover", nargs="?", const="both", choices=["tcp", "neighbors", "both"],
+                        help="Find live hosts first, by knocking on a few common ports, from the ARP/neighbor table, or both (default: both)")
+    parser.add_argument("--discover-ports", help=f"Comma-separated ports knocked on during discovery (default: {','.join(map(str, DISCOVERY_PORTS))})")
+    parser.add_argument("--unresponsive", choices=["skip", "report", "scan"], default="skip",
+                        help="What to do with hosts that answer nothing during discovery: skip them, skip and list them, or scan them anyway (default: skip)")
     parser.add_argument("--banner", action="store_true", help="Grab banner/header from open ports")
     parser.add_argument("-o", "--output", help="Output file in JSON format")
+    parser.add_argument("--format", choices=["json", "jsonl"], default="json", help="json collects the full result, jsonl streams one line per probe (default: json)")
+    parser.add_argument("--open-only", action="store_true", help="Only report open ports")
+    parser.add_argument("--state", help="SQLite file recording every probe, needed for --resume and --diff")
+    parser.add_argument("--resume", action="store_true", help="Continue the last unfinished scan with the same targets and ports")
+    parser.add_argument("--diff", action="store_true", help="Only report ports that opened or closed since the previous finished scan")
     parser.add_argument("--username", help="Username for authentication")
     parser.add_argument("--password", help="Password for authentication")
     return parser.parse_args()
@@ -134,19 +761,81 @@ def main():
         with open(args.portlist, "r") as port_file:
             port_list = [int(line.strip()) for line in port_file]
 
-    if args.cidr:
-        results = asyncio.run(scan_cidr(args.cidr, port_list, args.banner, args.username, args.password, args.timeout))
-        output_file_name = args.cidr.replace("/", "_") if not args.output else args.output
-    elif args.range:
-        start_ip, end_ip = args.range.split('-')
-        results = asyncio.run(scan_range(start_ip, end_ip, port_list, args.banner, args.username, args.password, args.timeout))
-        output_file_name = args.range.replace("/", "_") if not args.output else args.output
-    elif args.file:
-        results = asyncio.run(scan_file(args.file, port_list, args.banner, args.username, args.password, args.timeout))
-        output_file_name = args.file if not args.output else args.output
+    single_ip = not (args.cidr or args.range or args.file)
+    sharded = args.procs > 1 and not single_ip
+
+    if (args.resume or args.diff) and not args.state:
+        print("Error: --resume and --diff need --state.")
+        sys.exit(1)
+
+    state = ScanState(args.state, scan_spec(args, port_list), args.resume) if args.state else None
+    # Shards rebuild the targets from the same seed, so they sample the hosts the parent walks
+    seed = state.seed if state is not None else random.randrange(1 << 32)
+    random.seed(seed)
+
+    try:
+        targets, output_file_name = build_targets(args)
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    collector = None
+    jsonl_file = None
+    if args.diff:
+        sink = lambda result: None
+    elif args.format == "jsonl":
+        jsonl_file = open(output_path(output_file_name, "jsonl"), 'w') if args.output else sys.stdout
+        sink = jsonl_writer(jsonl_file, args.open_only)
     else:
-        results = asyncio.run(scan_ports(args.ip, port_list, args.banner, args.username, args.password, args.timeout))
-        output_file_name = args.ip if not args.output else args.output
+        collector = ResultCollector(port_list, args.open_only)
+        targets = collector.register(targets)
+        sink = collector.collect
+
+    try:
+        on_result, skip = sink, None
+        if state is not None:
+            if state.resumed:
+                print(f"Resuming: {state.replay(sink)} probes already done.", file=sys.stderr)
+                skip = state.probed
+
+            def on_result(result):
+                state.record(result)
+                sink(result)
+
+        if sharded:
+            # Registering every target up front keeps the collected results in target order, as in a single-process scan
+            if collector is not None:
+                collections.deque(targets, maxlen=0)
+            up, down = sharded_scan(args, port_list, on_result, state.run_id if skip is not None else None, seed)
+        else:
+            scheduler = ScanScheduler(args.max_in_flight, args.rate)
+            discovery = build_discovery(args)
+            asyncio.run(stream_targets(targets, port_list, on_result, args.banner, args.username, args.password, args.timeout, scheduler, skip, discovery))
+            up, down = (discovery.up, discovery.down) if discovery is not None else (0, 0)
+        if args.discover:
+            print(f"Discovery: {up} hosts up, {down} did not answer.", file=sys.stderr)
+        if state is not None:
+            state.finish()
+            changes = state.changes() if args.diff else None
+    finally:
+        if jsonl_file is not None and jsonl_file is not sys.stdout:
+            jsonl_file.close()
+        if state is not None:
+            state.close()
+
+    if args.diff:
+        if args.format == "jsonl":
+            save_to_jsonl(changes, output_file_name if args.output else None)
+        elif args.output:
+            save_to_json(changes, output_file_name)
+        else:
+            print_changes(changes)
+        return
+    if collector is None:
+        return
+
+    results = collector.collected()
+    if single_ip:
+        results = results[0] if results else []
 
     if args.output:
         save_to_json(results, output_file_name)
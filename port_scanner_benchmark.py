@@ -0,0 +1,177 @@
+# Benchmark port_scanner.py against a simulated network of loopback hosts
+# Every host is a 127.0.1.x address with the same port layout:
+#   open    - accepts and stays silent
+#   banner  - talk-first service that greets after --latency
+#   rst     - nothing listening, the kernel answers with a reset
+#   drop    - listening socket with a full backlog that never accepts, so SYNs are silently dropped
+# Loopback cannot delay the handshake itself, so --latency applies to the service response
+
+import argparse
+import asyncio
+import ipaddress
+import multiprocessing
+import os
+import resource
+import socket
+import time
+
+import port_scanner
+
+FIRST_HOST = ipaddress.ip_address("127.0.1.1")
+BASE_PORT = 20000
+FD_SAMPLE_INTERVAL = 0.05
+
+def raise_fd_limit():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+def port_layout(open_ports, banner_ports, rst_ports, drop_ports):
+    layout = {}
+    port = BASE_PORT
+    for behaviour, count in (("open", open_ports), ("banner", banner_ports), ("rst", rst_ports), ("drop", drop_ports)):
+        for _ in range(count):
+            layout[port] = behaviour
+            port += 1
+    return layout
+
+def host_addresses(hosts):
+    return [str(FIRST_HOST + index) for index in range(hosts)]
+
+def banner_for(host, port):
+    return f"SSH-2.0-sim_{host}_{port}"
+
+async def serve_network(hosts, layout, latency, ready):
+    async def silent(reader, writer):
+        await reader.read()
+        writer.close()
+
+    def talker(host, port):
+        async def talk(reader, writer):
+            if latency:
+                await asyncio.sleep(latency)
+            writer.write(f"{banner_for(host, port)}\r\n".encode())
+            await writer.drain()
+            await reader.read()
+            writer.close()
+        return talk
+
+    servers = []
+    blocked = []
+    for host in hosts:
+        for port, behaviour in layout.items():
+            if behaviour == "open":
+                servers.append(await asyncio.start_server(silent, host, port))
+            elif behaviour == "banner":
+                servers.append(await asyncio.start_server(talker(host, port), host, port))
+            elif behaviour == "drop":
+                blocked.extend(block_port(host, port))
+
+    ready.send(True)
+    await asyncio.Event().wait()
+
+# With a backlog of 0 one queued connection fills the accept queue, later SYNs get no answer
+def block_port(host, port):
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind((host, port))
+    listener.listen(0)
+    sockets = [listener]
+    for _ in range(2):
+        filler = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        filler.setblocking(False)
+        filler.connect_ex((host, port))
+        sockets.append(filler)
+    return sockets
+
+def run_network(hosts, layout, latency, ready):
+    raise_fd_limit()
+    asyncio.run(serve_network(hosts, layout, latency, ready))
+
+def start_network(hosts, layout, latency):
+    parent_end, child_end = multiprocessing.Pipe()
+    network = multiprocessing.Process(target=run_network, args=(hosts, layout, latency, child_end), daemon=True)
+    network.start()
+    if not parent_end.poll(60):
+        network.terminate()
+        raise RuntimeError("Simulated network did not start")
+    parent_end.recv()
+    return network
+
+def open_fds():
+    try:
+        return len(os.listdir("/proc/self/fd"))
+    except OSError:
+        return None
+
+async def run_scan(hosts, ports, banner, timeout, max_in_flight, rate):
+    results = []
+    peak_fds = open_fds()
+    scheduler = port_scanner.ScanScheduler(max_in_flight, rate)
+
+    async def sample_fds():
+        nonlocal peak_fds
+        while True:
+            await asyncio.sleep(FD_SAMPLE_INTERVAL)
+            fds = open_fds()
+            if fds is not None:
+                peak_fds = max(peak_fds, fds)
+
+    sampler = asyncio.create_task(sample_fds())
+    start = time.perf_counter()
+    try:
+        await port_scanner.stream_targets(hosts, ports, results.append, banner, timeout=timeout, scheduler=scheduler)
+    finally:
+        sampler.cancel()
+    return results, time.perf_counter() - start, peak_fds
+
+def score(results, layout, banner):
+    false_closed = false_open = banner_misses = 0
+    for result in results:
+        behaviour = layout[result["port"]]
+        is_open = result["status"] == "Open"
+        if behaviour in ("open", "banner") and not is_open:
+            false_closed += 1
+        elif behaviour in ("rst", "drop") and is_open:
+            false_open += 1
+        elif banner and behaviour == "banner" and result.get("banner") != banner_for(result["ip"], result["port"]):
+            banner_misses += 1
+    return false_closed, false_open, banner_misses
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark port_scanner.py against a simulated loopback network")
+    parser.add_argument("--hosts", type=int, default=200, help="Number of simulated hosts (default: 200)")
+    parser.add_argument("--open-ports", type=int, default=2, help="Silent listening ports per host (default: 2)")
+    parser.add_argument("--banner-ports", type=int, default=2, help="Banner-speaking ports per host (default: 2)")
+    parser.add_argument("--rst-ports", type=int, default=8, help="Ports per host that answer with a reset (default: 8)")
+    parser.add_argument("--drop-ports", type=int, default=1, help="Ports per host that silently drop SYNs (default: 1)")
+    parser.add_argument("--latency", type=float, default=0.01, help="Delay before a banner service greets, in seconds (default: 0.01)")
+    parser.add_argument("--banner", action="store_true", help="Grab banners while scanning")
+    parser.add_argument("-t", "--timeout", type=float, default=0.5, help="Scanner timeout in seconds (default: 0.5)")
+    parser.add_argument("--max-in-flight", type=int, default=port_scanner.MAX_IN_FLIGHT, help="Scanner connections in flight")
+    parser.add_argument("--rate", type=float, help="Scanner target connections per second (default: unlimited)")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    raise_fd_limit()
+    hosts = host_addresses(args.hosts)
+    layout = port_layout(args.open_ports, args.banner_ports, args.rst_ports, args.drop_ports)
+    network = start_network(hosts, layout, args.latency)
+
+    try:
+        results, elapsed, peak_fds = asyncio.run(run_scan(hosts, list(layout), args.banner, args.timeout, args.max_in_flight, args.rate))
+    finally:
+        network.terminate()
+        network.join()
+
+    false_closed, false_open, banner_misses = score(results, layout, args.banner)
+    # ru_maxrss is in kilobytes on Linux
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    probes = len(results)
+    print(f"{probes} probes over {len(hosts)} hosts x {len(layout)} ports in {elapsed:.2f}s -> {probes / elapsed:.0f} probes/s")
+    print(f"Peak memory: {peak_rss:.1f} MiB, peak open FDs: {peak_fds if peak_fds is not None else 'n/a'}")
+    print(f"False closed: {false_closed}, false open: {false_open}" + (f", wrong banners: {banner_misses}" if args.banner else ""))
+
+if __name__ == "__main__":
+    main()